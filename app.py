@@ -4,16 +4,28 @@
 
 import json
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, session, make_response, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-import sys
+import hashlib
+import threading
+import click
+from flask.cli import AppGroup
+from itertools import groupby
+from functools import lru_cache
+from cache import make_cache, cached, cached_version
+from dbpool import engine_options, pool_status
+from replicas import RoutingSQLAlchemy
+import sqlstats
+import metrics
+import applog
+from bookings import MAX_DURATION as SHOW_MAX_DURATION, add_booking_constraints
+from suggest import PrefixIndex
+from partitions import is_partitioned, ensure_partitions, archive_partitions, add_months, month_start
+from datetime import timedelta
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,8 +33,15 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
+cache = make_cache(app.config)
+sqlstats.init_app(app)
+metrics.init_app(app, cache)
+# registered last so its after_request runs first and settles the log sample
+# before sqlstats logs
+applog.init_app(app)
 
 # TODO: connect to a local postgresql database
 
@@ -30,6 +49,26 @@ migrate = Migrate(app, db)
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+    __tablename__ = 'genres'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+# association tables; the (genre_id, ...) indexes serve the ?genre= listings.
+# the database drops the rows of a deleted venue or artist (ON DELETE CASCADE).
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id'),
+)
+
 class Venue(db.Model):
     __tablename__ = 'venues'
 
@@ -39,14 +78,31 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(), nullable=False)
+    genres = db.relationship("Genre", secondary=venue_genres, lazy=True, passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String())
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String())
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    shows = db.relationship("Show", backref="venues", lazy=True, cascade="all, delete-orphan")
+    # bumped by every write, the ETags of the pages showing this row derive from it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+    # denormalized show counters, kept current by the show write paths and
+    # `flask shows sweep`, so listings never aggregate over the shows table
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # deleting a venue leaves its shows and genre links to ON DELETE CASCADE
+    # instead of loading them and deleting them one by one
+    shows = db.relationship("Show", backref="venues", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+
+    # trigram GIN indexes that back the partial-string venue search, and the
+    # (city, state) index the area listing is read in
+    __table_args__ = (
+      db.Index("ix_venues_city_state", "city", "state"),
+      db.Index("ix_venues_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+      db.Index("ix_venues_city_trgm", "city", postgresql_using="gin", postgresql_ops={"city": "gin_trgm_ops"}),
+      db.Index("ix_venues_state_trgm", "state", postgresql_using="gin", postgresql_ops={"state": "gin_trgm_ops"}),
+    )
 
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
@@ -59,39 +115,417 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship("Genre", secondary=artist_genres, lazy=True, passive_deletes=True)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120)) 
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    shows = db.relationship("Show", backref="artists", lazy=True, cascade="all, delete-orphan")
+    # bumped by every write, the ETags of the pages showing this row derive from it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+    # denormalized show counters, kept current by the show write paths and
+    # `flask shows sweep`, so listings never aggregate over the shows table
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    shows = db.relationship("Show", backref="artists", lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+
+    # trigram GIN indexes that back the partial-string artist search
+    __table_args__ = (
+      db.Index("ix_artists_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+      db.Index("ix_artists_city_trgm", "city", postgresql_using="gin", postgresql_ops={"city": "gin_trgm_ops"}),
+      db.Index("ix_artists_state_trgm", "state", postgresql_using="gin", postgresql_ops={"state": "gin_trgm_ops"}),
+    )
 
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+# /artists lists, pages and jumps to initials by name regardless of case, over
+# the (upper(name), id) index
+artist_sort_key = db.func.upper(Artist.name)
+db.Index("ix_artists_upper_name_id", artist_sort_key, Artist.id)
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+def default_show_end(context):
+  # shows listed without an end time last SHOW_DURATION_MINUTES
+  return context.get_current_parameters()["start_time"] + timedelta(minutes=app.config["SHOW_DURATION_MINUTES"])
+
+# on postgres shows is range-partitioned by month on start_time (partitions.py),
+# which makes its real primary key (id, start_time); ids still come from one
+# sequence, so the model keeps id as its identity.
 class Show(db.Model):
     __tablename__ = "shows"
 
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id"), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey("venues.id"), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id", ondelete="CASCADE"), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey("venues.id", ondelete="CASCADE"), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # the venue and the artist are booked over [start_time, end_time); overlapping
+    # bookings are refused by the database, see bookings.py
+    end_time = db.Column(db.DateTime, nullable=False, default=default_show_end)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    # every past/upcoming split filters on one side of the show plus start_time,
+    # and /shows pages through (start_time, id). the first two also serve the
+    # double-booking lookups.
+    __table_args__ = (
+      db.Index("ix_shows_venue_id_start_time", "venue_id", "start_time"),
+      db.Index("ix_shows_artist_id_start_time", "artist_id", "start_time"),
+      db.Index("ix_shows_start_time_id", "start_time", "id"),
+      db.CheckConstraint("end_time > start_time", name="ck_shows_end_time"),
+    )
+
+# past shows moved out of shows by `flask shows archive`, partitioned the same
+# way on postgres. reads that need past shows go through all_shows().
+shows_archive = db.Table('shows_archive',
+    db.Column('id', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('artist_id', db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=False),
+    db.Column('venue_id', db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False),
+    db.Column('start_time', db.DateTime, nullable=False),
+    db.Column('end_time', db.DateTime, nullable=False),
+    db.Column('updated_at', db.DateTime, nullable=False, index=True),
+    db.Index('ix_shows_archive_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_archive_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_shows_archive_start_time_id', 'start_time', 'id'),
+    db.CheckConstraint('end_time > start_time', name='ck_shows_archive_end_time'),
+)
+
+# the trigram operator classes used by the search indexes live in pg_trgm
+db.event.listen(db.Model.metadata, "before_create",
+  db.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+# and btree_gist lets the double-booking exclusion constraints compare ids
+db.event.listen(db.Model.metadata, "before_create",
+  db.DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"))
+
+@db.event.listens_for(Show.__table__, "after_create")
+def create_booking_constraints(target, connection, **kw):
+  add_booking_constraints(connection, target.name)
+
+@db.event.listens_for(Genre.__table__, "after_create")
+def seed_genres(target, connection, **kw):
+  connection.execute(target.insert(), [{"name": name} for name in GENRES])
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# for each side of a show: the foreign key column pointing at it, the model on
+# the other side, the foreign key column pointing at that model and the key
+# prefix used for its columns in the templates.
+SHOW_JOINS = {
+  Venue: ("venue_id", Artist, "artist_id", "artist"),
+  Artist: ("artist_id", Venue, "venue_id", "venue"),
+}
+
+# association table and its foreign key column for each genred model
+GENRE_LINKS = {
+  Venue: (venue_genres, venue_genres.c.venue_id),
+  Artist: (artist_genres, artist_genres.c.artist_id),
+}
+
+def show_joins(model, shows=Show):
+  # SHOW_JOINS[model] with the foreign keys resolved against a show source,
+  # Show itself or all_shows()
+  show_fk, counterpart, counterpart_fk, prefix = SHOW_JOINS[model]
+  return getattr(shows, show_fk), counterpart, getattr(shows, counterpart_fk), prefix
+
+def all_shows():
+  # the shows to read wherever past shows matter: on postgres the live table
+  # plus the partitions `flask shows archive` moved into shows_archive, as one
+  # aliased Show. nothing is archived elsewhere, so there it is just Show.
+  # queries that only want upcoming shows keep using Show.
+  if db.engine.dialect.name != "postgresql":
+    return Show
+  archived = db.select(*[shows_archive.c[column.name] for column in Show.__table__.c])
+  return db.aliased(Show, db.union_all(db.select(Show.__table__), archived).subquery("all_shows"))
+
+def genre_names(model):
+  # comma-joined genre names of a venue or artist as a correlated subquery, so
+  # they can ride along in the query that loads the entity.
+  link, link_fk = GENRE_LINKS[model]
+  if db.engine.dialect.name == "postgresql":
+    names = db.func.string_agg(Genre.name, ",")
+  else:
+    names = db.func.group_concat(Genre.name, ",")
+  return db.session.query(names).select_from(link).join(Genre, Genre.id == link.c.genre_id).filter(
+   link_fk == model.id).correlate(model).scalar_subquery()
+
+def with_genre(query, model, genre):
+  # narrows a query over venues or artists to those tagged with the given genre
+  link, link_fk = GENRE_LINKS[model]
+  return query.join(link, link_fk == model.id).join(Genre, Genre.id == link.c.genre_id).filter(Genre.name == genre)
+
+def genres_named(names):
+  return Genre.query.filter(Genre.name.in_(names)).all()
+
+def with_genre_choices(form):
+  form.genres.choices = [(name, name) for name, in db.session.query(Genre.name).order_by(Genre.name)]
+  return form
+
+def entity_timeline(model, entity_id):
+  # loads a venue or an artist together with all of its shows and the joined
+  # counterpart columns in a single round trip, then splits the shows into
+  # past and upcoming in one pass, with the entity's genre names aggregated in
+  # the same statement. returns None when the entity does not exist.
+  shows = all_shows()
+  show_fk, counterpart, counterpart_fk, prefix = show_joins(model, shows)
+  rows = db.session.query(model, genre_names(model).label("genres"), shows.start_time, counterpart.id.label("counterpart_id"),
+   counterpart.name.label("counterpart_name"), counterpart.image_link.label("counterpart_image_link")).outerjoin(
+   shows, show_fk == model.id).outerjoin(counterpart, counterpart_fk == counterpart.id).filter(
+   model.id == entity_id).order_by(shows.start_time).all()
+
+  if not rows:
+    return None
+
+  now = datetime.now()
+  past_shows = []
+  upcoming_shows = []
+  for row in rows:
+    # an entity without shows still comes back as a single row with NULL show columns
+    if row.start_time is None:
+      continue
+    show = {
+      prefix + "_id": row.counterpart_id,
+      prefix + "_name": row.counterpart_name,
+      prefix + "_image_link": row.counterpart_image_link,
+      "start_time": row.start_time,
+    }
+    if row.start_time > now:
+      upcoming_shows.append(show)
+    else:
+      past_shows.append(show)
+
+  genres = rows[0].genres.split(",") if rows[0].genres else []
+  return rows[0][0], genres, past_shows, upcoming_shows
+
+
+def search_entities(model, search_term):
+  # partial, case-insensitive match on name, city or state, most relevant first,
+  # reading each hit's upcoming-show count from its maintained counter. on
+  # postgres the ILIKEs are served by the pg_trgm GIN indexes and results are
+  # ranked by trigram similarity; other databases (sqlite in development) fall
+  # back to ranking exact and prefix name matches above the rest.
+  pattern = f"%{search_term}%"
+  query = db.session.query(model.id, model.name, model.upcoming_shows_count.label("num_upcoming_shows")).filter(
+    model.name.ilike(pattern) |
+    model.city.ilike(pattern) |
+    model.state.ilike(pattern)
+  )
+
+  if db.engine.dialect.name == "postgresql":
+    rank = db.func.greatest(db.func.similarity(model.name, search_term),
+     db.func.similarity(model.city, search_term), db.func.similarity(model.state, search_term))
+  else:
+    rank = db.case(
+      (db.func.lower(model.name) == search_term.lower(), 3),
+      (model.name.ilike(f"{search_term}%"), 2),
+      (model.name.ilike(pattern), 1),
+      else_=0)
+
+  return query.order_by(rank.desc(), model.name)
+
+
+def booked(venue_id, artist_id, start_time, end_time):
+  # (venue busy, artist busy) over [start_time, end_time), in one statement.
+  # looks at shows only, archived shows are history (see bookings.py).
+  # shows last at most SHOW_MAX_DURATION, so only those starting less than that
+  # before start_time can overlap: each side is a short range scan of its
+  # (..._id, start_time) index.
+  def overlapping(show_fk, entity_id):
+    return db.session.query(Show.id).filter(show_fk == entity_id, Show.start_time > start_time - SHOW_MAX_DURATION,
+     Show.start_time < end_time, Show.end_time > start_time).exists()
+  return tuple(db.session.query(overlapping(Show.venue_id, venue_id), overlapping(Show.artist_id, artist_id)).one())
+
+def lock_bookings(venue_id, artist_id):
+  # on postgres, holds off other bookings of the venue and the artist until the
+  # transaction ends, so booked() stays true to the insert that follows it:
+  # the exclusion constraints cannot see overlaps across monthly partitions.
+  # always venue first, then artist, so two bookings cannot deadlock.
+  if db.engine.dialect.name == "postgresql":
+    db.session.execute(db.text("SELECT pg_advisory_xact_lock(1, :venue_id), pg_advisory_xact_lock(2, :artist_id)"),
+     {"venue_id": venue_id, "artist_id": artist_id})
+
+def count_new_show(show):
+  # bumps the counters of a newly inserted show's venue and artist, in the
+  # caller's transaction.
+  column = "upcoming_shows_count" if show.start_time > datetime.now() else "past_shows_count"
+  for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    counter = getattr(model, column)
+    model.query.filter(model.id == entity_id).update({counter: counter + 1}, synchronize_session=False)
+
+def uncount_shows_of(model, entity_id):
+  # takes the shows of a venue (or artist) that is about to be deleted off the
+  # counters of the artists (or venues) on the other side of those shows.
+  # counters that drifted since the last sweep are corrected by the next one.
+  shows = all_shows()
+  show_fk, counterpart, counterpart_fk, prefix = show_joins(model, shows)
+  now = datetime.now()
+
+  def shows_count(*criteria):
+    return db.session.query(db.func.count(shows.id)).filter(
+     show_fk == entity_id, counterpart_fk == counterpart.id, *criteria).correlate(counterpart).scalar_subquery()
+
+  counterpart.query.filter(counterpart.id.in_(db.session.query(counterpart_fk).filter(show_fk == entity_id))).update({
+    counterpart.upcoming_shows_count: counterpart.upcoming_shows_count - shows_count(shows.start_time > now),
+    counterpart.past_shows_count: counterpart.past_shows_count - shows_count(shows.start_time <= now),
+  }, synchronize_session=False)
+
+def counterpart_ids(model, entity_id):
+  # ids of the artists a venue has shows with, or of the venues an artist plays at
+  show_fk, counterpart, counterpart_fk, prefix = show_joins(model, all_shows())
+  return [counterpart_id for counterpart_id, in db.session.query(counterpart_fk).filter(show_fk == entity_id).distinct()]
+
+def delete_entity(model, entity_id):
+  # deletes a venue or an artist with one DELETE: the database cascades it to
+  # the shows (archived ones included) and genre links. returns its name.
+  entity = model.query.get(entity_id)
+  name = entity.name
+  counterparts = counterpart_ids(model, entity_id)
+  uncount_shows_of(model, entity_id)
+  db.session.delete(entity)
+  db.session.commit()
+  suggest_indexes[model].remove(entity_id)
+  if model is Venue:
+    invalidate_pages(venue_ids=[entity_id], artist_ids=counterparts)
+  else:
+    invalidate_pages(venue_ids=counterparts, artist_ids=[entity_id])
+  return name
+
+# name prefix indexes behind /api/suggest, one per process, see suggest.py
+suggest_indexes = {Venue: PrefixIndex(), Artist: PrefixIndex()}
+
+def suggest_index(model):
+  # builds the index on first use, in the request since there is nothing to
+  # answer from yet, and again once SUGGEST_MAX_AGE seconds old (picking up
+  # names written by other processes) on a background thread, the current
+  # entries answering meanwhile
+  index = suggest_indexes[model]
+  if index.claim_build(app.config["SUGGEST_MAX_AGE"]):
+    if index.built_at is None:
+      build_suggest_index(model, index)
+    else:
+      threading.Thread(target=rebuild_suggest_index, args=(model, index), daemon=True).start()
+  return index
+
+def build_suggest_index(model, index):
+  try:
+    index.build(db.session.query(model.id, model.name).all())
+  except Exception:
+    index.abandon_build()
+    raise
+
+def rebuild_suggest_index(model, index):
+  # runs on its own thread, so with its own app context and session
+  with app.app_context():
+    try:
+      build_suggest_index(model, index)
+    except Exception:
+      app.logger.exception('Suggestion index could not be rebuilt', extra={'table': model.__tablename__})
+    finally:
+      db.session.remove()
+
+def touch_entities(model, entity_ids):
+  # bumps updated_at of the given venues or artists, in the caller's
+  # transaction, when something their pages show changed on another row
+  if entity_ids:
+    model.query.filter(model.id.in_(entity_ids)).update({model.updated_at: datetime.utcnow()},
+     synchronize_session=False)
+
+def invalidate_pages(venue_ids=(), artist_ids=()):
+  # drops the cached view models of the given venue and artist pages
+  cache.delete(*["venue:{}".format(venue_id) for venue_id in venue_ids] +
+   ["artist:{}".format(artist_id) for artist_id in artist_ids])
+
+def sweep_show_counters():
+  # recomputes every venue and artist counter from the shows table, moving shows
+  # whose start_time has passed from upcoming to past. meant to run periodically
+  # (see `flask shows sweep`), not per request.
+  now = datetime.now()
+  past = all_shows()
+  for model in (Venue, Artist):
+
+    def shows_count(shows, *criteria):
+      return db.session.query(db.func.count(shows.id)).filter(show_joins(model, shows)[0] == model.id,
+       *criteria).correlate(model).scalar_subquery()
+
+    # archived shows are all past, upcoming ones only need the live table
+    upcoming_shows_count = shows_count(Show, Show.start_time > now)
+    past_shows_count = shows_count(past, past.start_time <= now)
+    # only touch rows whose counts moved, so unchanged pages keep their ETags
+    model.query.filter(db.or_(model.upcoming_shows_count != upcoming_shows_count,
+     model.past_shows_count != past_shows_count)).update({
+      model.upcoming_shows_count: upcoming_shows_count,
+      model.past_shows_count: past_shows_count,
+    }, synchronize_session=False)
+  db.session.commit()
+
+def entity_validators(model, entity_id):
+  # the version of a venue or artist page, from its own row (a primary key
+  # lookup): every write the page shows bumps the row's updated_at or its show
+  # counters, edits of its counterparts included (see touch_entities), and
+  # `flask shows sweep` moves passed shows from upcoming to past. returns None
+  # when the entity does not exist.
+  return db.session.query(model.updated_at, model.upcoming_shows_count, model.past_shows_count).filter(
+   model.id == entity_id).first()
+
+def table_validators(models, *extra):
+  # newest updated_at and row count of each table (the count catches deletes),
+  # plus any extra scalar subqueries, in a single statement
+  columns = list(extra)
+  for model in models:
+    columns.append(db.session.query(db.func.max(model.updated_at)).scalar_subquery())
+    columns.append(db.session.query(db.func.count(model.id)).scalar_subquery())
+  return tuple(db.session.query(*columns).one())
+
+def conditional_page(validators, render):
+  # answers 304 when the client's If-None-Match already names this version of
+  # the page, otherwise renders it and tags it with ETag/Last-Modified. pages
+  # carrying flash messages are neither matched nor tagged.
+  if session.get("_flashes"):
+    return render()
+
+  etag = hashlib.sha1(repr((request.full_path,) + tuple(validators)).encode()).hexdigest()
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = make_response(render())
+  response.set_etag(etag)
+  # some validators are start times of upcoming shows; only updated_at values
+  # (utc, never in the future) are modification times
+  now = datetime.utcnow()
+  timestamps = [value for value in validators if isinstance(value, datetime) and value <= now]
+  if timestamps:
+    response.last_modified = max(timestamps)
+  # let browsers and the CDN keep the page but revalidate it on every use
+  response.cache_control.no_cache = True
+  return response
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # babel re-parses the pattern string and the locale on every format_datetime
+  # call; there are only a handful of (format, locale) pairs, so compile each once
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale='en'):
+  # takes the start_time datetimes straight from the views (strings are still
+  # parsed for older callers); output is memoized since listings repeat timestamps
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=babel.dates.UTC)
+  pattern, babel_locale = datetime_pattern(format, locale)
+  return pattern.apply(value, babel_locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -109,6 +543,30 @@ def index():
 
 # show all venues functionality
 # ------------------------------------------
+def venue_areas(genre=None):
+  # builds the city/state areas for the venues page from a single query over the
+  # venues table, reading the maintained upcoming-show counter and ordering so
+  # that venues of the same area come out next to each other.
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+   Venue.upcoming_shows_count.label("num_upcoming_shows"))
+  if genre:
+    query = with_genre(query, Venue, genre)
+  rows = query.order_by(Venue.city, Venue.state, Venue.id).all()
+
+  areas = []
+  for (city, state), area_venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    areas.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.num_upcoming_shows,
+      } for venue in area_venues]
+    })
+  return areas
+
+
 @app.route('/venues')
 def venues():
   # TODO: replace with real venues data.
@@ -126,29 +584,9 @@ def venues():
   #     "num_upcoming_shows": 1,
   #   }]
   # }]
-  data = []
-  venues = Venue.query.all()
-  for venue in venues:
-    grouped_venue = {
-          "city": venue.city,
-          "state": venue.state
-      }
-    filtered_venues = Venue.query.filter_by(city=venue.city, state=venue.state).all()
-
-    filtered_venues_arr = []
-    for filtered_venue in filtered_venues:
-          num_upcoming_shows_count = db.session.query(Show).filter(Show.venue_id == venue.id).filter(
-              Show.start_time > datetime.now()).join(Artist, Show.artist_id == Artist.id).count()
-          filtered_venues_arr.append({
-              "id": filtered_venue.id,
-              "name": filtered_venue.name,
-              "num_upcoming_shows": num_upcoming_shows_count,
-          })
-      
-    grouped_venue["venues"] = filtered_venues_arr
-    data.append(grouped_venue)
-  #print(data)    
-  return render_template('pages/venues.html', areas=data) 
+  genre = request.args.get("genre")
+  return conditional_page(table_validators([Venue]),
+   lambda: render_template('pages/venues.html', areas=venue_areas(genre), genre=genre))
 
 
 
@@ -169,11 +607,7 @@ def search_venues():
   #   }]
   # }
   response={}
-  venues = list(Venue.query.filter(
-        Venue.name.ilike(f"%{search_term}%") |
-        Venue.state.ilike(f"%{search_term}%") |
-        Venue.city.ilike(f"%{search_term}%") 
-    ).all())
+  venues = search_entities(Venue, search_term).all()
   response["count"] = len(venues)
   response["data"] = []
 
@@ -181,12 +615,38 @@ def search_venues():
     searched_data = {
       "id": venue.id,
       "name": venue.name,
-      "num_upcoming_shows": len(list(filter(lambda x: x.start_time > datetime.now(), venue.shows)))
+      "num_upcoming_shows": venue.num_upcoming_shows
     }
     response["data"].append(searched_data)
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 # venues details
+def venue_page_data(venue_id):
+  # view model of the venue page, cached by show_venue
+  timeline = entity_timeline(Venue, venue_id)
+  if timeline is None:
+    return None
+  venue, genres, past_shows, upcoming_shows = timeline
+
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website_link,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
@@ -214,66 +674,24 @@ def show_venue(venue_id):
   #   "past_shows_count": 1,
   #   "upcoming_shows_count": 0,
   # }
-  venue = Venue.query.get(venue_id)
-
-  setattr(venue, "genres", venue.genres.split(","))
-
-  past_shows_query = db.session.query(Show).filter(Show.venue_id == venue_id).filter(
-   Show.start_time < datetime.now()).join(Artist, Show.artist_id == Artist.id).add_columns(Artist.id, Artist.name,
-   Artist.image_link, Show.start_time)
-
-  past_shows = past_shows_query.all()
-
-  past_shows_count = past_shows_query.count()
-
-  past_shows_arr = []
-
-  for past_show in past_shows:
-    past_shows_dict = {}
-    past_shows_dict['artist_name'] = past_show.name
-    past_shows_dict['artist_id'] = past_show.id
-    past_shows_dict['artist_image_link'] = past_show.image_link
-    past_shows_dict['start_time'] = past_show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-    past_shows_arr.append(past_shows_dict)
-
-  #print(past_shows)
-  setattr(venue, "past_shows", past_shows_arr)
-  setattr(venue, "past_shows_count", past_shows_count)
+  validators = entity_validators(Venue, venue_id)
+  if validators is None:
+    abort(404)
 
+  def render():
+    data = cached_version(cache, "venue:{}".format(venue_id), tuple(validators), lambda: venue_page_data(venue_id))
+    if data is None:
+      abort(404)
+    return render_template('pages/show_venue.html', venue=data)
 
-  upcoming_shows_query = db.session.query(Show).filter(Show.venue_id == venue_id).filter(
-   Show.start_time > datetime.now()).join(Artist, Show.artist_id == Artist.id).add_columns(Artist.id, Artist.name,
-   Artist.image_link, Show.start_time)
-
-  upcoming_shows = upcoming_shows_query.all()
-
-  upcoming_shows_count = upcoming_shows_query.count()
-
-  upcoming_shows_arr = []
-
-  for upcoming_show in upcoming_shows:
-    upcoming_shows_dict = {}
-    upcoming_shows_dict['artist_name'] = upcoming_show.name
-    upcoming_shows_dict['artist_id'] = upcoming_show.id
-    upcoming_shows_dict['artist_image_link'] = upcoming_show.image_link
-    upcoming_shows_dict['start_time'] = upcoming_show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-    upcoming_shows_arr.append(upcoming_shows_dict)
-
-  #print(past_shows)
-  setattr(venue, "upcoming_shows", upcoming_shows_arr)
-  setattr(venue, "upcoming_shows_count", upcoming_shows_count)
-
-  #data = list(filter(lambda d: d['id'] == venue_id, [data]))[0]
-  return render_template('pages/show_venue.html', venue=venue)
+  return conditional_page(validators, render)
 
 
 #  Create Venue
 #  ---------------------------------------------------------------
 @app.route('/venues/create', methods=['GET'])
 def create_venue_form():
-  form = VenueForm()
+  form = with_genre_choices(VenueForm())
   return render_template('forms/new_venue.html', form=form)
 
 @app.route('/venues/create', methods=['POST'])
@@ -282,7 +700,7 @@ def create_venue_submission():
     # TODO: modify data to be the data object returned from db insertion
     #body = {}
 
-    form = VenueForm(request.form)
+    form = with_genre_choices(VenueForm(request.form))
 
     if form.validate(): 
       try:
@@ -291,7 +709,7 @@ def create_venue_submission():
         state = form.state.data
         address = form.address.data
         phone = form.phone.data
-        genres=",".join(form.genres.data)
+        genres = genres_named(form.genres.data)
         image_link = form.image_link.data
         facebook_link = form.facebook_link.data
         website_link = form.website_link.data
@@ -313,7 +731,10 @@ def create_venue_submission():
           )
 
         db.session.add(new_venue)
+        db.session.flush()
+        venue_id = new_venue.id
         db.session.commit()
+        suggest_indexes[Venue].put(venue_id, name)
         #body['name'] = new_venue.name
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
@@ -322,7 +743,7 @@ def create_venue_submission():
       # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
       # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Venue could not be listed', extra={'venue_name': request.form['name']})
         flash('Venue ' + request.form['name'] + ' could not be listed.')
 
       finally:
@@ -347,13 +768,10 @@ def delete_venue(venue_id):
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
     try:
-      venue = Venue.query.get(venue_id)
-      db.session.delete(venue)
-      db.session.commit()
-      flash("Venue " + venue.name + " was deleted successfully!")
+      flash("Venue " + delete_entity(Venue, venue_id) + " was deleted successfully!")
     except:
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('Venue could not be deleted', extra={'venue_id': venue_id})
       flash("Venue was not deleted successfully.")
     finally:
       db.session.close()
@@ -366,7 +784,7 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
+  form = with_genre_choices(VenueForm())
   # venue={
   #   "id": 1,
   #   "name": "The Musical Hop",
@@ -382,15 +800,15 @@ def edit_venue(venue_id):
   #   "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
   # }
   # TODO: populate form with values from venue with ID <venue_id>
-  venue = Venue.query.get(venue_id)
-  form.genres.data = venue.genres.split(",")
+  venue = Venue.query.get_or_404(venue_id)
+  form.genres.data = [genre.name for genre in venue.genres]
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
-  form = VenueForm(request.form)
+  form = with_genre_choices(VenueForm(request.form))
   if form.validate():
 
     try:
@@ -401,21 +819,27 @@ def edit_venue_submission(venue_id):
       venue.state=form.state.data
       venue.address=form.address.data
       venue.phone=form.phone.data
-      venue.genres=",".join(form.genres.data)
+      venue.genres=genres_named(form.genres.data)
       venue.facebook_link=form.facebook_link.data
       venue.image_link=form.image_link.data
       venue.seeking_talent=form.seeking_talent.data
       venue.seeking_description=form.seeking_description.data
       venue.website_link=form.website_link.data
+      venue.updated_at=datetime.utcnow()
 
       db.session.add(venue)
+      # the venue's name and image also appear on the pages of its artists
+      artist_ids = counterpart_ids(Venue, venue_id)
+      touch_entities(Artist, artist_ids)
       db.session.commit()
+      invalidate_pages(venue_ids=[venue_id], artist_ids=artist_ids)
+      suggest_indexes[Venue].put(venue_id, form.name.data)
 
       flash("Venue " + form.name.data + " edited successfully")
         
     except Exception:
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('Venue could not be edited', extra={'venue_id': venue_id})
       flash("Venue was not edited successfully.")
     finally:
       db.session.close()
@@ -436,6 +860,56 @@ def edit_venue_submission(venue_id):
 
 #  show all Artists
 #  ----------------------------------------------------------------
+def encode_artist_cursor(artist):
+  # keyset cursor for /artists: the (name, id) of the last artist on the page,
+  # id first since names may contain the separator
+  return "{}_{}".format(artist.id, artist.name)
+
+def decode_artist_cursor(cursor):
+  if not cursor:
+    return None
+  artist_id, name = cursor.split("_", 1)
+  return name, int(artist_id)
+
+def artist_index_key(genre):
+  return "artists:index:{}".format(genre or "")
+
+def next_char(letter):
+  # the character after letter: every name starting with letter sorts before it
+  if db.engine.dialect.name == "postgresql":
+    return db.func.chr(db.func.ascii(letter) + 1)
+  return db.func.char(db.func.unicode(letter) + 1)
+
+def artist_index(genre):
+  # initials the artists (of a genre) start with, for the A-Z jump links on
+  # /artists, kept in the page cache. a skip scan over the (upper(name), id)
+  # index: each step of the recursive query seeks the first name past the
+  # previous initial, so it reads one index entry per initial, not the table.
+  def build():
+    def first_name(previous=None):
+      query = db.session.query(artist_sort_key).filter(Artist.name.isnot(None))
+      if genre:
+        query = with_genre(query, Artist, genre)
+      if previous is not None:
+        # key > previous keeps the walk moving under any collation
+        query = query.filter(artist_sort_key >= next_char(db.func.substr(previous, 1, 1)),
+         artist_sort_key > previous)
+      return query.order_by(artist_sort_key).limit(1).scalar_subquery()
+
+    names = db.session.query(first_name().label("name")).cte("initials", recursive=True)
+    names = names.union_all(db.session.query(first_name(names.c.name)).filter(names.c.name.isnot(None)))
+    letters = []
+    for letter, in db.session.query(db.func.substr(names.c.name, 1, 1)).filter(names.c.name.isnot(None)):
+      if letter not in letters:
+        letters.append(letter)
+    return letters
+  return cached(cache, artist_index_key(genre), build)
+
+def invalidate_artist_index(genres=()):
+  # a new or renamed artist may bring a new initial to /artists and to the
+  # listings of its genres. initials left without artists simply expire.
+  cache.delete(*[artist_index_key(genre) for genre in [None] + list(genres)])
+
 @app.route('/artists')
 def artists():
   # TODO: replace with real data returned from querying the database
@@ -443,10 +917,39 @@ def artists():
   #   "id": 4,
   #   "name": "Guns N Petals",
   # }]
-  data = Artist.query.with_entities(Artist.id, Artist.name).all()
-  data = Artist.query.all()
-  #data = db.session.query(Artist.id, Artist.name).all() ------ working too
-  return render_template('pages/artists.html', artists=data)
+  genre = request.args.get("genre")
+  initial = request.args.get("from")
+  try:
+    after = decode_artist_cursor(request.args.get("after"))
+  except ValueError:
+    abort(400)
+
+  # only the rendered columns, one page at a time in (upper(name), id) order
+  query = db.session.query(Artist.id, Artist.name).filter(Artist.name.isnot(None))
+  if genre:
+    query = with_genre(query, Artist, genre)
+  if after is not None:
+    name, artist_id = after
+    query = query.filter(db.tuple_(artist_sort_key, Artist.id) > db.tuple_(db.func.upper(name), artist_id))
+  elif initial:
+    query = query.filter(artist_sort_key >= db.func.upper(initial))
+  per_page = app.config["ARTISTS_PER_PAGE"]
+  rows = query.order_by(artist_sort_key, Artist.id).limit(per_page + 1).all()
+
+  next_url = None
+  if len(rows) > per_page:
+    rows = rows[:per_page]
+    args = request.args.to_dict()
+    args.pop("from", None)
+    args["after"] = encode_artist_cursor(rows[-1])
+    next_url = url_for('artists', **args)
+  letters = artist_index(genre)
+
+  def render():
+    return render_template('pages/artists.html', artists=rows, genre=genre, letters=letters, next_url=next_url)
+
+  # the page is small enough to be its own validator: no table-wide count
+  return conditional_page([tuple(row) for row in rows] + letters, render)
 
 
 #  search artist
@@ -465,11 +968,7 @@ def search_artists():
   #   }]
   # }
   search_term = request.form.get('search_term', '')
-  artists = Artist.query.filter(
-    Artist.name.ilike(f"%{search_term}%") |
-    Artist.city.ilike(f"%{search_term}%") |
-    Artist.state.ilike(f"%{search_term}%")
-  ).all()
+  artists = search_entities(Artist, search_term).all()
 
   response = {
             "count": len(artists),
@@ -481,11 +980,7 @@ def search_artists():
       searched_data["name"] = artist.name
       searched_data["id"] = artist.id
 
-      upcoming_shows = 0
-      for show in artist.shows:
-          if show.start_time > datetime.now():
-              upcoming_shows = upcoming_shows + 1
-      searched_data["upcoming_shows"] = upcoming_shows
+      searched_data["num_upcoming_shows"] = artist.num_upcoming_shows
 
       response["data"].append(searched_data)
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
@@ -493,6 +988,31 @@ def search_artists():
 
 # show artist details
 # ----------------------------------------
+def artist_page_data(artist_id):
+  # view model of the artist page, cached by show_artist
+  timeline = entity_timeline(Artist, artist_id)
+  if timeline is None:
+    return None
+  artist, genres, past_shows, upcoming_shows = timeline
+
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website_link,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
@@ -519,58 +1039,17 @@ def show_artist(artist_id):
   #   "past_shows_count": 1,
   #   "upcoming_shows_count": 0,
   # }
-  artist = Artist.query.get(artist_id)
-  setattr(artist, 'genres', artist.genres.split(","))
+  validators = entity_validators(Artist, artist_id)
+  if validators is None:
+    abort(404)
 
-  past_shows_query = db.session.query(Show).filter(Show.artist_id == artist_id).filter(
-   Show.start_time < datetime.now()).join(Venue, Show.venue_id == Venue.id).add_columns(Venue.id, Venue.name,
-   Venue.image_link, Show.start_time)
+  def render():
+    data = cached_version(cache, "artist:{}".format(artist_id), tuple(validators), lambda: artist_page_data(artist_id))
+    if data is None:
+      abort(404)
+    return render_template('pages/show_artist.html', artist=data)
 
-
-  past_shows = past_shows_query.all()
-  past_shows_count = past_shows_query.count()
-
-  past_shows_arr = []
-
-  for past_show in past_shows:
-    past_shows_dict = {}
-    past_shows_dict['venue_name'] = past_show.name
-    past_shows_dict['venue_id'] = past_show.id
-    past_shows_dict['venue_image_link'] = past_show.image_link
-    past_shows_dict['start_time'] = past_show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-    past_shows_arr.append( past_shows_dict)
-
-  #print(past_shows)
-  setattr(artist, "past_shows", past_shows_arr)
-  setattr(artist, "past_shows_count", past_shows_count)
-
-
-  upcoming_shows_query = db.session.query(Show).filter(Show.artist_id == artist_id).filter(
-   Show.start_time > datetime.now()).join(Venue, Show.venue_id == Venue.id).add_columns(Venue.id, Venue.name,
-   Venue.image_link, Show.start_time)
-
-
-  upcoming_shows = upcoming_shows_query.all()
-  upcoming_shows_count = upcoming_shows_query.count()
-
-  upcoming_shows_arr = []
-
-  for upcoming_show in upcoming_shows:
-    upcoming_shows_dict = {}
-    upcoming_shows_dict['venue_name'] = upcoming_show.name
-    upcoming_shows_dict['venue_id'] = upcoming_show.id
-    upcoming_shows_dict['venue_image_link'] = upcoming_show.image_link
-    upcoming_shows_dict['start_time'] = upcoming_show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-
-    upcoming_shows_arr.append(upcoming_shows_dict)
-
-  #print(past_shows)
-  setattr(artist, "upcoming_shows", upcoming_shows_arr)
-  setattr(artist, "upcoming_shows_count", upcoming_shows_count)
-
-  #data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_artist.html', artist=artist)
+  return conditional_page(validators, render)
 
 
 
@@ -578,7 +1057,7 @@ def show_artist(artist_id):
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
+  form = with_genre_choices(ArtistForm())
   # artist={
   #   "id": 4,
   #   "name": "Guns N Petals",
@@ -593,15 +1072,15 @@ def edit_artist(artist_id):
   #   "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
   # }
   # TODO: populate form with fields from artist with ID <artist_id>
-  artist = Artist.query.get(artist_id)
-  form.genres.data = artist.genres.split(",")
+  artist = Artist.query.get_or_404(artist_id)
+  form.genres.data = [genre.name for genre in artist.genres]
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
-  form = ArtistForm(request.form)
+  form = with_genre_choices(ArtistForm(request.form))
   if form.validate:
     try:
       artist = Artist.query.get(artist_id)
@@ -610,19 +1089,26 @@ def edit_artist_submission(artist_id):
       artist.city=form.city.data
       artist.state=form.state.data
       artist.phone=form.phone.data
-      artist.genres=",".join(form.genres.data)
+      artist.genres=genres_named(form.genres.data)
       artist.facebook_link=form.facebook_link.data
       artist.image_link=form.image_link.data
       artist.seeking_venue=form.seeking_venue.data
       artist.seeking_description=form.seeking_description.data
       artist.website_link=form.website_link.data
+      artist.updated_at=datetime.utcnow()
 
       db.session.add(artist)
+      # the artist's name and image also appear on the pages of its venues
+      venue_ids = counterpart_ids(Artist, artist_id)
+      touch_entities(Venue, venue_ids)
       db.session.commit()
+      invalidate_pages(venue_ids=venue_ids, artist_ids=[artist_id])
+      invalidate_artist_index(form.genres.data)
+      suggest_indexes[Artist].put(artist_id, form.name.data)
       flash("Artist " + artist.name + " was successfully edited!")
     except:
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('Artist could not be edited', extra={'artist_id': artist_id})
       flash("Artist was not edited successfully.")
     finally:
       db.session.close()
@@ -640,7 +1126,7 @@ def edit_artist_submission(artist_id):
 
 @app.route('/artists/create', methods=['GET'])
 def create_artist_form():
-  form = ArtistForm()
+  form = with_genre_choices(ArtistForm())
   return render_template('forms/new_artist.html', form=form)
 
 @app.route('/artists/create', methods=['POST'])
@@ -648,7 +1134,7 @@ def create_artist_submission():
   # called upon submitting the new artist listing form
   # TODO: insert form data as a new Venue record in the db, instead
   # TODO: modify data to be the data object returned from db insertion
-  form = ArtistForm(request.form)
+  form = with_genre_choices(ArtistForm(request.form))
   if form.validate:
     try:
       new_artist = Artist(
@@ -656,7 +1142,7 @@ def create_artist_submission():
         city=form.city.data,
         state=form.state.data,
         phone=form.phone.data,
-        genres=",".join(form.genres.data),
+        genres=genres_named(form.genres.data),
         image_link=form.image_link.data,
         facebook_link=form.facebook_link.data,
         website_link=form.website_link.data,
@@ -664,11 +1150,16 @@ def create_artist_submission():
         seeking_description=form.seeking_description.data,
       )
       db.session.add(new_artist)
+      db.session.flush()
+      artist_id = new_artist.id
       db.session.commit()
+      invalidate_artist_index(form.genres.data)
+      suggest_indexes[Artist].put(artist_id, form.name.data)
       # on successful db insert, flash success
       flash("Artist " + request.form["name"] + " was successfully listed!")
     except Exception:
       db.session.rollback()
+      app.logger.exception('Artist could not be listed', extra={'artist_name': request.form['name']})
       # TODO: on unsuccessful db insert, flash an error instead.
       # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
       flash("Artist was not successfully listed.")
@@ -680,6 +1171,21 @@ def create_artist_submission():
   return render_template('pages/home.html')
 
 
+#  Delete artist
+#  ----------------------------------------------------------------
+@app.route('/artists/<int:artist_id>/del', methods=['DELETE','GET','POST'])
+def delete_artist(artist_id):
+  try:
+    flash("Artist " + delete_entity(Artist, artist_id) + " was deleted successfully!")
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Artist could not be deleted', extra={'artist_id': artist_id})
+    flash("Artist was not deleted successfully.")
+  finally:
+    db.session.close()
+  return render_template('pages/home.html')
+
+
 
 
 
@@ -690,6 +1196,21 @@ def create_artist_submission():
 
 #  display all shows
 #  ----------------------------------------------------------------
+def encode_show_cursor(start_time, show_id):
+  # keyset cursor for /shows: the (start_time, id) of the last show on the page
+  return "{}_{}".format(start_time.isoformat(), show_id)
+
+def decode_show_cursor(cursor):
+  if not cursor:
+    return None
+  start_time, show_id = cursor.rsplit("_", 1)
+  return datetime.fromisoformat(start_time), int(show_id)
+
+def parse_date_arg(value):
+  if not value:
+    return None
+  return datetime.strptime(value, "%Y-%m-%d")
+
 
 @app.route('/shows')
 def shows():
@@ -704,20 +1225,62 @@ def shows():
   #   "start_time": "2019-05-21T21:30:00.000Z"
   # }]
 
-  data = []
-
-  shows = Show.query.all()
-  for show in shows:
-    shows_dict = {}
-    shows_dict["venue_id"] = show.venues.id
-    shows_dict["venue_name"] = show.venues.name
-    shows_dict["artist_id"] = show.artists.id
-    shows_dict["artist_name"] = show.artists.name
-    shows_dict["artist_image_link"] = show.artists.image_link
-    shows_dict["start_time"] = show.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-      
-    data.append(shows_dict)
-  return render_template('pages/shows.html', shows=data)
+  when = request.args.get("when")
+  try:
+    date_from = parse_date_arg(request.args.get("from"))
+    date_to = parse_date_arg(request.args.get("to"))
+    after = decode_show_cursor(request.args.get("after"))
+  except ValueError:
+    abort(400)
+
+  def render():
+    # only upcoming listings can skip the archive
+    shows = Show if when == "upcoming" else all_shows()
+    query = db.session.query(shows.id, shows.start_time, Venue.id.label("venue_id"), Venue.name.label("venue_name"),
+     Artist.id.label("artist_id"), Artist.name.label("artist_name"), Artist.image_link.label("artist_image_link")).join(
+     Venue, shows.venue_id == Venue.id).join(Artist, shows.artist_id == Artist.id)
+
+    if when == "upcoming":
+      query = query.filter(shows.start_time > datetime.now())
+    elif when == "past":
+      query = query.filter(shows.start_time <= datetime.now())
+    if date_from is not None:
+      query = query.filter(shows.start_time >= date_from)
+    if date_to is not None:
+      query = query.filter(shows.start_time < date_to + timedelta(days=1))
+    if after is not None:
+      query = query.filter(db.tuple_(shows.start_time, shows.id) > after)
+
+    # one extra row tells us whether there is a next page without a count(*)
+    per_page = app.config["SHOWS_PER_PAGE"]
+    rows = query.order_by(shows.start_time, shows.id).limit(per_page + 1).all()
+
+    next_url = None
+    if len(rows) > per_page:
+      rows = rows[:per_page]
+      args = request.args.to_dict()
+      args["after"] = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+      next_url = url_for('shows', **args)
+
+    data = []
+    for show in rows:
+      data.append({
+        "venue_id": show.venue_id,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
+        "start_time": show.start_time,
+      })
+    return render_template('pages/shows.html', shows=data, next_url=next_url, when=when)
+
+  # shows only disappear through venue/artist deletes, which bump the counterpart
+  # rows, so the newest show change stands in for a count (archiving moves shows
+  # without changing them). the next show to start moves whenever a show turns
+  # from upcoming to past.
+  latest_show = db.session.query(db.func.max(Show.updated_at)).scalar_subquery()
+  next_show = db.session.query(db.func.min(Show.start_time)).filter(Show.start_time > datetime.now()).scalar_subquery()
+  return conditional_page(table_validators([Venue, Artist], latest_show, next_show), render)
 
 
 @app.route('/shows/create')
@@ -732,18 +1295,35 @@ def create_show_submission():
   # TODO: insert form data as a new Show record in the db, instead
   form = ShowForm(request.form)
   if form.validate():
+    start_time = form.start_time.data
+    end_time = form.end_time.data or start_time + timedelta(minutes=app.config["SHOW_DURATION_MINUTES"])
+    if not start_time < end_time <= start_time + SHOW_MAX_DURATION:
+      flash('Show could not be listed: it has to end after it starts, and within {} hours.'.format(
+        int(SHOW_MAX_DURATION.total_seconds() // 3600)))
+      return render_template('pages/home.html')
     try:
+      lock_bookings(form.venue_id.data, form.artist_id.data)
+      venue_busy, artist_busy = booked(form.venue_id.data, form.artist_id.data, start_time, end_time)
+      if venue_busy or artist_busy:
+        flash('Show could not be listed: the {} is already booked at that time.'.format(
+          'venue' if venue_busy else 'artist'))
+        return render_template('pages/home.html')
       new_show = Show(
           artist_id=form.artist_id.data,
           venue_id=form.venue_id.data,
-          start_time=form.start_time.data
+          start_time=start_time,
+          end_time=end_time
       )
       db.session.add(new_show)
+      db.session.flush()
+      count_new_show(new_show)
       db.session.commit()
+      invalidate_pages(venue_ids=[new_show.venue_id], artist_ids=[new_show.artist_id])
       flash('Show was successfully listed!')
     except Exception:
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('Show could not be listed', extra={
+        'venue_id': form.venue_id.data, 'artist_id': form.artist_id.data})
       # TODO: on unsuccessful db insert, flash an error instead.
       flash('An error occurred. Show could not be listed.')
     finally:
@@ -756,6 +1336,197 @@ def create_show_submission():
 
 
 
+# ----------------------------------------------------------------------------------------------------#
+#                                   api section
+# ----------------------------------------------------------------------------------------------------#
+
+# Read-only exports for partner integrations. Every endpoint streams NDJSON
+# (one object per line; ?format=json streams a JSON array instead) straight
+# off a server-side cursor, so a full export runs in constant memory.
+#   ?fields=a,b   only select and emit these fields
+#   ?limit=n      stop after n records; when there are more, the response
+#                 carries a Link: <...>; rel="next" header to the next page
+#   ?after=c      resume after cursor c: the id of the last venue/artist, or
+#                 "<start_time>_<id>" of the last show (as on /shows)
+
+def entity_api_columns(model):
+  columns = {name: getattr(model, name) for name in (
+    "id", "name", "city", "state", "phone", "image_link", "facebook_link", "website_link",
+    "seeking_description", "upcoming_shows_count", "past_shows_count")}
+  if model is Venue:
+    columns["address"] = Venue.address
+    columns["seeking_talent"] = Venue.seeking_talent
+  else:
+    columns["seeking_venue"] = Artist.seeking_venue
+  columns["genres"] = genre_names(model)
+  return columns
+
+def api_fields(columns):
+  requested = request.args.get("fields")
+  if not requested:
+    return list(columns)
+  fields = requested.split(",")
+  if not set(fields) <= set(columns):
+    abort(400)
+  return fields
+
+def api_value(field, value):
+  if field == "genres":
+    return value.split(",") if value else []
+  if isinstance(value, datetime):
+    return value.isoformat()
+  return value
+
+def api_response(query, fields, encode_cursor):
+  # query selects the fields, then the keyset columns encode_cursor takes
+  limit = request.args.get("limit")
+  headers = {}
+  if limit:
+    if not limit.isdigit():
+      abort(400)
+    # a page: read up front with one extra row, which tells whether there is a
+    # next one before the headers go out
+    limit = int(limit)
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit and limit:
+      args = request.args.to_dict()
+      args["after"] = encode_cursor(*rows[limit - 1][len(fields):])
+      headers["Link"] = '<{}>; rel="next"'.format(url_for(request.endpoint, **args))
+    rows = rows[:limit]
+  else:
+    rows = query.execution_options(stream_results=True).yield_per(app.config["API_BATCH_SIZE"])
+
+  def ndjson():
+    for row in rows:
+      yield json.dumps({field: api_value(field, row[i]) for i, field in enumerate(fields)}) + "\n"
+
+  def json_array():
+    separator = "["
+    for line in ndjson():
+      yield separator + line
+      separator = ","
+    yield "[]" if separator == "[" else "]"
+
+  if request.args.get("format") == "json":
+    return Response(stream_with_context(json_array()), mimetype="application/json", headers=headers)
+  return Response(stream_with_context(ndjson()), mimetype="application/x-ndjson", headers=headers)
+
+def entity_api(model):
+  columns = entity_api_columns(model)
+  fields = api_fields(columns)
+  query = db.session.query(*[columns[field] for field in fields] + [model.id]).order_by(model.id)
+  after = request.args.get("after")
+  if after:
+    if not after.isdigit():
+      abort(400)
+    query = query.filter(model.id > int(after))
+  return api_response(query, fields, str)
+
+@app.route('/api/venues')
+def api_venues():
+  return entity_api(Venue)
+
+@app.route('/api/artists')
+def api_artists():
+  return entity_api(Artist)
+
+@app.route('/api/shows')
+def api_shows():
+  shows = all_shows()
+  columns = {
+    "id": shows.id,
+    "start_time": shows.start_time,
+    "end_time": shows.end_time,
+    "venue_id": shows.venue_id,
+    "venue_name": Venue.name,
+    "artist_id": shows.artist_id,
+    "artist_name": Artist.name,
+    "artist_image_link": Artist.image_link,
+  }
+  fields = api_fields(columns)
+  try:
+    after = decode_show_cursor(request.args.get("after"))
+  except ValueError:
+    abort(400)
+
+  query = db.session.query(*[columns[field] for field in fields] + [shows.start_time, shows.id]).select_from(shows).join(
+   Venue, shows.venue_id == Venue.id).join(Artist, shows.artist_id == Artist.id).order_by(shows.start_time, shows.id)
+  if after is not None:
+    query = query.filter(db.tuple_(shows.start_time, shows.id) > after)
+  return api_response(query, fields, encode_show_cursor)
+
+@app.route('/api/availability')
+def api_availability():
+  # is the slot free for a show of this venue and artist?
+  # ?venue_id=&artist_id=&start_time=<iso>[&end_time=<iso>]
+  try:
+    venue_id = int(request.args["venue_id"])
+    artist_id = int(request.args["artist_id"])
+    start_time = datetime.fromisoformat(request.args["start_time"])
+    end_time = request.args.get("end_time")
+    end_time = datetime.fromisoformat(end_time) if end_time else start_time + timedelta(
+      minutes=app.config["SHOW_DURATION_MINUTES"])
+  except (KeyError, ValueError):
+    abort(400)
+  if not start_time < end_time <= start_time + SHOW_MAX_DURATION:
+    abort(400)
+  venue_busy, artist_busy = booked(venue_id, artist_id, start_time, end_time)
+  return jsonify({
+    "free": not (venue_busy or artist_busy),
+    "venue_free": not venue_busy,
+    "artist_free": not artist_busy,
+  })
+
+@app.route('/api/suggest')
+def api_suggest():
+  # typeahead: the first names of artists or venues starting with q, in
+  # alphabetical order. ?type=artist|venue&q=<prefix>[&limit=]
+  model = {"artist": Artist, "venue": Venue}.get(request.args.get("type"))
+  if model is None:
+    abort(400)
+  limit = request.args.get("limit", str(app.config["SUGGEST_LIMIT"]))
+  if not limit.isdigit():
+    abort(400)
+  limit = min(int(limit), app.config["SUGGEST_MAX_LIMIT"])
+  prefix = request.args.get("q", "")
+  if not prefix.strip():
+    return jsonify({"data": []})
+  matches = suggest_index(model).search(prefix, limit)
+  return jsonify({"data": [{"id": entity_id, "name": name} for entity_id, name in matches]})
+
+
+
+#  cache statistics
+#  ----------------------------------------------------------------
+
+@app.route('/cache/stats')
+def cache_stats():
+  # hit/miss/eviction counters of this process' page cache, for tuning
+  # CACHE_MAX_ENTRIES and CACHE_TTL
+  return jsonify(cache.stats.as_dict())
+
+
+
+#  connection pool statistics
+#  ----------------------------------------------------------------
+
+@app.route('/db/pool')
+def db_pool_stats():
+  # checkout wait times and saturation of this process' connection pool
+  return jsonify(pool_status(db.engine))
+
+
+
+#  prometheus metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def prometheus_metrics():
+  # request, database, cache and template timings of every worker, see metrics.py
+  return metrics.metrics_response()
+
+
+
 # ----------------------------------------------------------------------------------------------------#
 #                         error section
 # ----------------------------------------------------------------------------------------------------#
@@ -769,15 +1540,65 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+shows_cli = AppGroup('shows', help='Maintenance tasks for shows.')
+
+@shows_cli.command('sweep')
+def sweep_shows_command():
+  """Recompute the upcoming/past show counters of every venue and artist."""
+  sweep_show_counters()
+  click.echo('Show counters refreshed.')
+
+@shows_cli.command('partition')
+def partition_shows_command():
+  """Create the monthly shows partitions for the months ahead (Postgres)."""
+  with db.engine.begin() as connection:
+    if not is_partitioned(connection, 'shows'):
+      raise click.ClickException('The shows table is not partitioned.')
+    created = ensure_partitions(connection, 'shows', app.config['SHOWS_PARTITION_MONTHS_AHEAD'])
+  click.echo('Created {} partition(s){}'.format(len(created), ': ' + ', '.join(created) if created else '.'))
+
+@shows_cli.command('archive')
+@click.option('--months', type=int, help='Months of past shows to keep live (default SHOWS_HOT_MONTHS).')
+def archive_shows_command(months):
+  """Move monthly shows partitions older than --months into shows_archive (Postgres)."""
+  if months is None:
+    months = app.config['SHOWS_HOT_MONTHS']
+  before = add_months(month_start(datetime.now()), -months)
+  with db.engine.begin() as connection:
+    if not is_partitioned(connection, 'shows'):
+      raise click.ClickException('The shows table is not partitioned.')
+    moved = archive_partitions(connection, 'shows', 'shows_archive', before)
+  click.echo('Archived {} partition(s) of shows before {:%Y-%m-%d}{}'.format(
+    len(moved), before, ': ' + ', '.join(moved) if moved else '.'))
+
+app.cli.add_command(shows_cli)
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+def import_command(kind, path, batch_size):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+  # imported here, importer pulls the models from this module
+  from importer import import_file
+  loaded, rejected = import_file(kind, path, batch_size, echo=click.echo)
+  if rejected:
+    click.echo('Rejected rows written to {}.rejects.ndjson'.format(path))
+
+@app.cli.command('seed')
+@click.option('--venues', default=100, show_default=True)
+@click.option('--artists', default=100, show_default=True)
+@click.option('--shows', default=1000, show_default=True)
+@click.option('--seed', 'random_seed', default=0, show_default=True, help='Seed of the random generator.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per insert.')
+def seed_command(venues, artists, shows, random_seed, batch_size):
+  """Add synthetic venues, artists and shows to the database."""
+  from seeder import seed_database
+  seed_database(venues, artists, shows, random_seed, batch_size, echo=click.echo)
 
 #----------------------------------------------------------------------------#
 # Launch.
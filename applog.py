@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# Logging that never writes from the request thread.
+#
+# Records from app.logger and its children (app.sql, app.access) are turned
+# into one JSON object per line where they are logged, with the request id,
+# method, path and endpoint of the request being handled, and put on a bounded
+# queue; a QueueListener thread writes them to stderr or LOG_FILE.
+# When the queue is full records are dropped rather than blocking the request.
+#
+# Every request gets an id, taken from an X-Request-ID header when the proxy
+# sets one, echoed in the response. Its access log line (app.access) carries
+# the status, latency and the SQL time and statement count from sqlstats.py.
+# Informational records of successful requests are kept for a LOG_SAMPLE_RATE
+# share of requests only; warnings, errors, failed (4xx/5xx) requests and
+# requests slower than LOG_SLOW_REQUEST_MS are always logged.
+
+# LogRecord attributes that are not extra fields
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((name, value) for name, value in vars(record).items() if name not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    # adds the current request to each record, and drops the informational
+    # records of requests left out of the sample
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        if record.levelno < logging.WARNING and not g.get('log_sampled', True):
+            return False
+        record.request_id = g.get('request_id')
+        record.method = request.method
+        record.path = request.path
+        record.endpoint = request.endpoint
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    # QueueHandler on a bounded queue that drops records when the writer
+    # thread falls behind, instead of reporting every one as a logging error
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def request_id():
+    return request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+
+
+def init_app(app):
+    log_queue = queue.Queue(app.config['LOG_QUEUE_SIZE'])
+    handler = DroppingQueueHandler(log_queue)
+    handler.setFormatter(JSONFormatter())
+    handler.addFilter(RequestContextFilter())
+
+    writers = []
+    if app.config['LOG_FILE']:
+        writers.append(logging.FileHandler(app.config['LOG_FILE']))
+    if app.debug or not writers:
+        writers.append(logging.StreamHandler())
+    listener = QueueListener(log_queue, *writers)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(handler)
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    access_logger = app.logger.getChild('access')
+    sample_rate = app.config['LOG_SAMPLE_RATE']
+    slow_seconds = app.config['LOG_SLOW_REQUEST_MS'] / 1000.0
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request_id()
+        g.log_started = time.perf_counter()
+        g.log_sampled = random.random() < sample_rate
+
+    @app.after_request
+    def log_request(response):
+        if 'log_started' not in g:
+            return response
+        seconds = time.perf_counter() - g.log_started
+        if response.status_code >= 400 or seconds >= slow_seconds:
+            # keep every record of this request, the sql log line included
+            g.log_sampled = True
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        fields = {'status': response.status_code, 'latency_ms': round(seconds * 1000, 2)}
+        stats = g.get('sql_stats')
+        if stats is not None:
+            fields.update(statements=stats.count, db_ms=round(stats.seconds * 1000, 2))
+        level = logging.ERROR if response.status_code >= 500 else logging.INFO
+        access_logger.log(level, 'request', extra=fields)
+        return response
@@ -0,0 +1,162 @@
+import io
+from itertools import islice
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import app, db
+from dbpool import async_database_uri, async_engine_options
+from replicas import ReplicaRouter, request_reads_from_replica
+
+# ASGI entry point for read-heavy traffic: `uvicorn asgi:application`.
+#
+# The read endpoints below run on the event loop. Their Flask views run
+# unchanged (same queries, page cache, conditional GET handling and templates)
+# inside AsyncSession.run_sync, which hands them a regular Session sitting on an
+# asyncpg connection (aiosqlite in development): a request waiting on the
+# database parks a coroutine instead of holding a thread, and the pool only
+# lends it a connection while it actually queries. Every other endpoint,
+# including all writes, is passed to the WSGI app on a thread pool.
+#
+# Needs uvicorn, a2wsgi and asyncpg (aiosqlite for sqlite), which the WSGI
+# deployment does not: pip install -r requirements-asgi.txt
+
+ASYNC_ENDPOINTS = {
+    'venues', 'artists', 'shows', 'show_venue', 'show_artist', 'search_venues', 'search_artists',
+    'api_venues', 'api_artists', 'api_shows', 'api_availability', 'api_suggest',
+}
+
+# records of a streamed /api response rendered per trip through run_sync
+STREAM_CHUNK = 100
+
+
+def create_engine(uri):
+    return create_async_engine(async_database_uri(uri),
+                               **async_engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=uri)))
+
+
+primary = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+# the router tracks pool checkouts, which only the sync side of an async engine has
+replicas = {engine.sync_engine: engine for engine in map(create_engine, app.config['SQLALCHEMY_REPLICA_URIS'])}
+router = ReplicaRouter(list(replicas), app.config['DB_REPLICA_STRATEGY'])
+
+wsgi = WSGIMiddleware(app)
+
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope['http_version']),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+def async_endpoint(environ):
+    try:
+        endpoint, _ = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        # 404s, 405s and redirects are left to the WSGI app
+        return None
+    return endpoint if endpoint in ASYNC_ENDPOINTS else None
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+def bound_to(sync_session, fn, *args):
+    # runs fn with db.session resolving to sync_session. db.session is scoped
+    # to the current greenlet and run_sync starts a fresh one on every call.
+    db.session.registry.set(sync_session)
+    try:
+        return fn(*args)
+    finally:
+        db.session.registry.clear()
+
+
+def dispatch():
+    # what Flask.wsgi_app does inside the request context
+    try:
+        return app.full_dispatch_request()
+    except Exception as e:
+        return app.handle_exception(e)
+
+
+async def send_response(send, response, session, head):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.items()],
+    })
+    if not response.is_streamed or head:
+        await send({'type': 'http.response.body', 'body': b'' if head else response.get_data()})
+        return
+
+    # a streamed response reads its rows lazily, so each chunk is produced in
+    # run_sync too; closing it closes the server-side cursor
+    chunks = response.iter_encoded()
+    try:
+        while True:
+            chunk = await session.run_sync(lambda _: list(islice(chunks, STREAM_CHUNK)))
+            if not chunk:
+                break
+            await send({'type': 'http.response.body', 'body': b''.join(chunk), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await session.run_sync(lambda _: response.close())
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for engine in [primary] + list(replicas.values()):
+                await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http' or async_endpoint(wsgi_environ(scope, b'')) is None:
+        return await wsgi(scope, receive, send)
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    with app.request_context(environ):
+        engine = primary
+        if request_reads_from_replica():
+            engine = replicas.get(router.pick(), primary)
+        async with AsyncSession(engine) as session:
+            response = await session.run_sync(bound_to, dispatch)
+            await send_response(send, response, session, scope['method'] == 'HEAD')
@@ -0,0 +1,123 @@
+"""Throughput of the read endpoints: WSGI (app.run) against ASGI (asgi.py).
+
+Starts each server in its own process on the same database, then keeps
+--concurrency clients requesting a mix of listing, detail, search and API
+URLs for --duration seconds, and reports requests/sec and latency
+percentiles. The database is seeded like benchmarks/check_query_plans.py
+(a temporary SQLite file unless DATABASE_URL is set); the gap that matters,
+requests parked on a slow database, only shows against a real Postgres.
+
+Run from the repository root:
+
+    python benchmarks/bench_asgi.py --concurrency 50 200 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from check_query_plans import fyyur, seed  # noqa: E402  (sets DATABASE_URL)
+
+SERVERS = {
+    'wsgi': [sys.executable, '-c',
+             'import app; app.app.run(port={port}, debug=False, use_reloader=False, threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', '{port}', '--log-level', 'warning'],
+}
+
+REQUESTS = [
+    ('GET', '/venues', None),
+    ('GET', '/artists', None),
+    ('GET', '/shows?when=upcoming', None),
+    ('GET', '/venues/{n}', None),
+    ('GET', '/artists/{n}', None),
+    ('POST', '/venues/search', {'search_term': 'Venue 1'}),
+    ('GET', '/api/shows?limit=200', None),
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start(kind):
+    port = free_port()
+    command = [part.format(port=port) for part in SERVERS[kind]]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = 'http://127.0.0.1:{}'.format(port)
+    for _ in range(100):
+        try:
+            httpx.get(base_url + '/')
+            return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('{} server did not start'.format(kind))
+
+
+async def load(base_url, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async def client(number):
+        nonlocal errors
+        sent = number
+        while time.monotonic() < deadline:
+            method, url, data = REQUESTS[sent % len(REQUESTS)]
+            url = url.format(n=sent % 100 + 1)
+            sent += concurrency
+            started = time.perf_counter()
+            try:
+                response = await http.request(method, url, data=data)
+                await response.aread()
+                errors += response.status_code != 200
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        await asyncio.gather(*[client(number) for number in range(concurrency)])
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    with fyyur.app.app_context():
+        seed()
+
+    print('{:<6} {:>6} {:>10} {:>9} {:>9} {:>7}'.format('server', 'conc', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for kind in SERVERS:
+        process, base_url = start(kind)
+        try:
+            for concurrency in args.concurrency:
+                latencies, errors = asyncio.run(load(base_url, concurrency, args.duration))
+                latencies.sort()
+                print('{:<6} {:>6} {:>10.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+                    kind, concurrency, len(latencies) / args.duration,
+                    percentile(latencies, 0.5), percentile(latencies, 0.99), errors))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Per-tile cost of the Jinja `datetime` filter, before and after.
+
+"before" is the original path: the view stringifies start_time with strftime
+and the filter parses it back with dateutil and hands babel a raw pattern.
+"after" is app.format_datetime fed the native datetime, for a page of tiles
+with distinct timestamps (cold memo) and the same page rendered again (warm).
+
+Run from the repository root:
+
+    python benchmarks/bench_datetime_filter.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+TILES = 1000
+REPEAT = 5
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def per_tile_us(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) / TILES * 1e6
+
+
+def main():
+    start = datetime(2026, 1, 1, 20, 30)
+    start_times = [start + timedelta(hours=i) for i in range(TILES)]
+
+    def before():
+        for start_time in start_times:
+            legacy_format_datetime(start_time.strftime("%m/%d/%Y, %H:%M:%S"), 'full')
+
+    def after_cold():
+        app.format_datetime.cache_clear()
+        for start_time in start_times:
+            app.format_datetime(start_time, 'full')
+
+    def after_warm():
+        for start_time in start_times:
+            app.format_datetime(start_time, 'full')
+
+    assert [app.format_datetime(t, 'full') for t in start_times] == \
+        [legacy_format_datetime(t.strftime("%m/%d/%Y, %H:%M:%S"), 'full') for t in start_times]
+
+    print('{} tiles, best of {}'.format(TILES, REPEAT))
+    print('before:          {:8.2f} us/tile'.format(per_tile_us(before)))
+    print('after (cold):    {:8.2f} us/tile'.format(per_tile_us(after_cold)))
+    print('after (memoized):{:8.2f} us/tile'.format(per_tile_us(after_warm)))
+
+
+if __name__ == '__main__':
+    main()
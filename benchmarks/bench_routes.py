@@ -0,0 +1,219 @@
+"""Per-route timings and SQL query counts at several data sizes.
+
+For every size the database is rebuilt and seeded with `size` venues, `size`
+artists and 10 * `size` shows (seeder.py), then every route of the app is
+requested --iterations times through the test client with a cold page cache.
+A route fails when it errors, when a request runs more SQL statements than its
+budget below (budgets do not grow with the data, so an N+1 shows up as soon as
+a page lists more rows), or when the app has a route this file does not know.
+
+Results are appended to --results as JSON lines tagged with the commit, and
+each run is compared with the previous one for the same database, size and
+route: a median more than --threshold slower is reported as a regression
+(and fails the run with --fail-on-regression).
+
+Uses a temporary SQLite file per size unless BENCH_DATABASE_URL is set. That
+database is dropped and recreated for every size, never point it at data you
+want to keep. Run from the repository root:
+
+    python benchmarks/bench_routes.py --sizes 100 1000 10000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMP_DIR = tempfile.mkdtemp()
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL')
+os.environ['DATABASE_URL'] = BENCH_DATABASE_URL or 'sqlite:///' + os.path.join(TEMP_DIR, 'bench.db')
+
+sys.path.insert(0, ROOT)
+
+import app as fyyur  # noqa: E402
+from cache import make_cache  # noqa: E402
+from seeder import seed_database  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+VENUE_FORM = {
+    'name': 'Bench Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Bench Street', 'phone': '512-555-0100',
+    'genres': ['Jazz', 'Blues'], 'facebook_link': 'https://www.facebook.com/bench', 'seeking_talent': 'y',
+}
+ARTIST_FORM = {
+    'name': 'Bench Artist', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0101',
+    'genres': ['Rock n Roll'], 'facebook_link': 'https://www.facebook.com/bench', 'seeking_venue': 'y',
+}
+
+# endpoint -> (method, url, form data, statement budget). {id} is a different
+# existing row on every iteration, {last} counts down from the highest id.
+ROUTES = {
+    'index': ('GET', '/', None, 0),
+    'venues': ('GET', '/venues', None, 2),
+    'artists': ('GET', '/artists', None, 2),
+    'shows': ('GET', '/shows', None, 2),
+    'show_venue': ('GET', '/venues/{id}', None, 2),
+    'show_artist': ('GET', '/artists/{id}', None, 2),
+    'search_venues': ('POST', '/venues/search', {'search_term': 'Hall'}, 1),
+    'search_artists': ('POST', '/artists/search', {'search_term': 'Band'}, 1),
+    'create_venue_form': ('GET', '/venues/create', None, 1),
+    'create_artist_form': ('GET', '/artists/create', None, 1),
+    'create_shows': ('GET', '/shows/create', None, 0),
+    'edit_venue': ('GET', '/venues/{id}/edit', None, 3),
+    'edit_artist': ('GET', '/artists/{id}/edit', None, 3),
+    'create_venue_submission': ('POST', '/venues/create', VENUE_FORM, 4),
+    'create_artist_submission': ('POST', '/artists/create', ARTIST_FORM, 4),
+    'create_show_submission': ('POST', '/shows/create', {'venue_id': '{id}', 'artist_id': '{id}',
+                                                         'start_time': '2030-01-01 20:00:00'}, 6),
+    # the edits also touch updated_at of the counterparts whose pages show the name
+    'edit_venue_submission': ('POST', '/venues/{id}/edit', VENUE_FORM, 10),
+    'edit_artist_submission': ('POST', '/artists/{id}/edit', ARTIST_FORM, 11),
+    'delete_venue': ('POST', '/venues/{last}/del', None, 4),
+    'delete_artist': ('POST', '/artists/{last}/del', None, 4),
+    'api_venues': ('GET', '/api/venues?limit=100', None, 1),
+    'api_artists': ('GET', '/api/artists?limit=100', None, 1),
+    'api_shows': ('GET', '/api/shows?limit=100', None, 1),
+    'api_availability': ('GET', '/api/availability?venue_id={id}&artist_id={id}&start_time=2030-01-01T20:00:00',
+                         None, 1),
+    # the prefix index is built on the first call of each process, then never queries
+    'api_suggest': ('GET', '/api/suggest?type=artist&q=b', None, 1),
+    'cache_stats': ('GET', '/cache/stats', None, 0),
+    'db_pool_stats': ('GET', '/db/pool', None, 0),
+    'prometheus_metrics': ('GET', '/metrics', None, 0),
+}
+
+# what the write views flash when they fail; they still answer 200
+FAILED = (b'could not be listed', b'was not ')
+
+
+def commit():
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=ROOT) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+def fill(value, size, iteration):
+    if isinstance(value, dict):
+        return {key: fill(item, size, iteration) for key, item in value.items()}
+    if isinstance(value, str):
+        return value.format(id=iteration % size + 1, last=size - iteration)
+    return value
+
+
+def rebuild(size):
+    db = fyyur.db
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    seed_database(size, size, size * 10, echo=lambda message: None)
+
+
+def measure(client, endpoint, size, iterations):
+    method, url, data, budget = ROUTES[endpoint]
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    timings = []
+    counts = []
+    error = None
+    engine = fyyur.db.engine
+    for iteration in range(iterations):
+        fyyur.cache = make_cache(fyyur.app.config)
+        del statements[:]
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            started = time.perf_counter()
+            response = client.open(fill(url, size, iteration), method=method, data=fill(data, size, iteration))
+            body = response.get_data()
+            timings.append(time.perf_counter() - started)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        counts.append(len(statements))
+        if response.status_code >= 400 or any(text in body for text in FAILED):
+            error = 'status {}'.format(response.status_code) if response.status_code >= 400 else 'flashed a failure'
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': sorted(timings)[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        'queries': max(counts),
+        'budget': budget,
+        'error': error,
+    }
+
+
+def previous_results(path):
+    latest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                latest[(record['dialect'], record['size'], record['endpoint'])] = record
+    return latest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--results', default=os.path.join(ROOT, 'benchmarks', 'results', 'routes.jsonl'))
+    parser.add_argument('--threshold', type=float, default=0.25, help='Slowdown reported as a regression.')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    app = fyyur.app
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+
+    rules = {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'}
+    failures = ['{}: no entry in ROUTES'.format(endpoint) for endpoint in sorted(rules - set(ROUTES))]
+    regressions = []
+    previous = previous_results(args.results)
+    revision = commit()
+    run_at = datetime.utcnow().isoformat()
+    os.makedirs(os.path.dirname(args.results), exist_ok=True)
+
+    with app.app_context(), open(args.results, 'a') as results:
+        dialect = fyyur.db.engine.dialect.name
+        print('{:>7} {:<26} {:>10} {:>9} {:>8}'.format('size', 'route', 'median ms', 'p95 ms', 'queries'))
+        for size in args.sizes:
+            rebuild(size)
+            for endpoint in ROUTES:
+                if endpoint not in rules:
+                    continue
+                result = measure(client, endpoint, size, min(args.iterations, size))
+                record = dict(result, commit=revision, run_at=run_at, dialect=dialect, size=size, endpoint=endpoint)
+                results.write(json.dumps(record) + '\n')
+
+                notes = []
+                if result['error']:
+                    notes.append(result['error'])
+                if result['queries'] > result['budget']:
+                    notes.append('over budget of {}'.format(result['budget']))
+                if notes:
+                    failures.append('{} at {}: {}'.format(endpoint, size, ', '.join(notes)))
+                before = previous.get((dialect, size, endpoint))
+                if before and result['median_ms'] > before['median_ms'] * (1 + args.threshold):
+                    regressions.append('{} at {}: {:.2f} ms, was {:.2f} ms at {}'.format(
+                        endpoint, size, result['median_ms'], before['median_ms'], before['commit']))
+                    notes.append('slower')
+                print('{:>7} {:<26} {:>10.2f} {:>9.2f} {:>8} {}'.format(
+                    size, endpoint, result['median_ms'], result['p95_ms'], result['queries'], ', '.join(notes)))
+
+    for line in regressions:
+        print('REGRESSION ' + line)
+    for line in failures:
+        print('FAIL ' + line)
+    return 1 if failures or (regressions and args.fail_on_regression) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
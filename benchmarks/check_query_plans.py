@@ -0,0 +1,110 @@
+"""Query-plan regression check for the hot pages.
+
+Seeds a throwaway database, requests each page below, captures every SQL
+statement it runs and EXPLAINs them. A page fails when any of its statements
+reads one of the guarded tables with a full scan instead of an index.
+
+Run from the repository root; without DATABASE_URL a temporary SQLite file is
+used. Against Postgres point DATABASE_URL at an empty database (it is seeded
+and ANALYZEd) and seq scans are disabled for the EXPLAINs, so the check is
+about whether a usable index exists, not about planner costs at this size:
+
+    python benchmarks/check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'plans.db')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as fyyur  # noqa: E402
+from seeder import seed_database  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+VENUES = 500
+ARTISTS = 500
+SHOWS = 20000
+
+# page -> tables that must only be read through an index
+ROUTES = [
+    ('/venues', {'venues'}),
+    ('/venues?genre=Jazz', {'venue_genres', 'artist_genres'}),
+    ('/venues/1', {'shows'}),
+    ('/artists', {'artists'}),
+    ('/artists?from=M', {'artists'}),
+    ('/artists/1', {'shows'}),
+    ('/shows', {'shows'}),
+    ('/shows?when=upcoming', {'shows'}),
+]
+
+
+def seed():
+    fyyur.db.create_all()
+    if fyyur.db.session.query(fyyur.Venue.id).first() is None:
+        seed_database(VENUES, ARTISTS, SHOWS, echo=lambda message: None)
+
+
+def full_scans(connection, statement, parameters):
+    # names of the tables the statement reads without an index
+    cursor = connection.cursor()
+    if fyyur.db.engine.dialect.name == 'postgresql':
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plans = [cursor.fetchone()[0][0]['Plan']]
+        tables = set()
+        while plans:
+            plan = plans.pop()
+            if plan['Node Type'] == 'Seq Scan':
+                tables.add(plan['Relation Name'])
+            plans.extend(plan.get('Plans', []))
+        return tables
+
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    tables = set()
+    for row in cursor.fetchall():
+        words = row[-1].split()
+        if words[0] == 'SCAN' and 'USING' not in words:
+            tables.add(words[2] if words[1] == 'TABLE' else words[1])
+    return tables
+
+
+def main():
+    app = fyyur.app
+    app.config['TESTING'] = True
+    client = app.test_client()
+    failures = 0
+    with app.app_context():
+        seed()
+        engine = fyyur.db.engine
+        connection = engine.raw_connection()
+        if engine.dialect.name == 'postgresql':
+            connection.cursor().execute('SET enable_seqscan = off')
+
+        for url, guarded in ROUTES:
+            statements = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                statements.append((statement, parameters))
+
+            event.listen(engine, 'before_cursor_execute', capture)
+            try:
+                status = client.get(url).status_code
+            finally:
+                event.remove(engine, 'before_cursor_execute', capture)
+
+            scanned = set()
+            for statement, parameters in statements:
+                scanned |= full_scans(connection, statement, parameters) & guarded
+            ok = status == 200 and not scanned
+            failures += not ok
+            print('{:<4} {:<24} {} statements{}'.format(
+                'ok' if ok else 'FAIL', url, len(statements),
+                '' if ok else ', status {}, full scan of {}'.format(status, ', '.join(sorted(scanned)) or '-')))
+        connection.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from sqlalchemy import text
+
+# Double-booking rules for shows.
+#
+# A show takes its venue and its artist over [start_time, end_time) and lasts
+# at most MAX_DURATION. No two shows of one venue, or of one artist, overlap:
+#   postgres - EXCLUDE USING gist constraints over tsrange(start_time, end_time),
+#              btree_gist supplying the gist operator class for the ids. On the
+#              partitioned shows table a constraint only sees its own
+#              partition, so every partition of shows gets them (the default
+#              one included, and the monthly ones `flask shows partition`
+#              creates) and create_show_submission checks across partitions
+#              under an advisory lock.
+#   sqlite   - BEFORE INSERT/UPDATE triggers running the same lookup
+#
+# Thanks to MAX_DURATION only shows starting less than that before a slot can
+# overlap it, so "is this slot free" is a short range scan of the
+# (venue_id, start_time) or (artist_id, start_time) index, however many shows
+# there are.
+#
+# Only shows is checked, not shows_archive: the archive holds months that
+# `flask shows archive` moved out as history, and bookings are not made that
+# far back.
+
+MAX_DURATION = timedelta(hours=24)
+
+BOOKED_COLUMNS = ('venue_id', 'artist_id')
+
+SQLITE_OVERLAP = (
+    "EXISTS (SELECT 1 FROM {table} WHERE {column} = NEW.{column}{other_rows} "
+    "AND start_time > datetime(NEW.start_time, '-{hours} hours') "
+    "AND start_time < NEW.end_time AND end_time > NEW.start_time)"
+)
+
+SQLITE_TRIGGER = (
+    "CREATE TRIGGER {table}_no_double_booking_{name} BEFORE {event} ON {table} "
+    "WHEN julianday(NEW.end_time) - julianday(NEW.start_time) > {days} OR {overlaps} "
+    "BEGIN SELECT RAISE(ABORT, 'show is too long or overlaps another show of its venue or artist'); END"
+)
+
+
+def exclude_overlaps(connection, table):
+    # postgres: the exclusion constraints of one (non-partitioned) table or partition
+    for column in BOOKED_COLUMNS:
+        connection.execute(text(
+            'ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_overlap '
+            'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'.format(
+                table=table, column=column)))
+
+
+def add_booking_constraints(connection, table):
+    hours = int(MAX_DURATION.total_seconds() // 3600)
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            "ALTER TABLE {table} ADD CONSTRAINT ck_{table}_max_duration "
+            "CHECK (end_time <= start_time + interval '{hours} hours')".format(table=table, hours=hours)))
+        exclude_overlaps(connection, table)
+    elif connection.dialect.name == 'sqlite':
+        # an updated row must not count as overlapping itself; a new one has no id yet
+        for name, event, other_rows in [
+            ('insert', 'INSERT', ''),
+            ('update', 'UPDATE OF venue_id, artist_id, start_time, end_time', ' AND id <> NEW.id'),
+        ]:
+            overlaps = ' OR '.join(SQLITE_OVERLAP.format(table=table, column=column, other_rows=other_rows, hours=hours)
+                                   for column in BOOKED_COLUMNS)
+            connection.execute(text(SQLITE_TRIGGER.format(
+                table=table, name=name, event=event, days=hours / 24.0, overlaps=overlaps)))
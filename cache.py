@@ -0,0 +1,170 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache for the view models built by the detail pages.
+#
+# Two backends share the same get/set/delete/stats interface:
+#   LRUCache    - in-process, bounded by entry count and TTL
+#   SharedCache - shared between processes through a redis-like client
+#                 (get/set/delete); LocalClient stands in for redis locally
+
+
+class CacheStats(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # callables given (name, count) for every record, see metrics.py
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def record(self, name, count=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + count)
+        for listener in self.listeners:
+            listener(name, count)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+class LRUCache(object):
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.stats.record('evictions')
+                entry = None
+            if entry is None:
+                self.stats.record('misses')
+                return None
+            self._entries.move_to_end(key)
+        self.stats.record('hits')
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.record('evictions')
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalClient(object):
+    # the subset of the redis client api SharedCache relies on, kept in a dict
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.monotonic():
+                del self._values[name]
+                return None
+            return entry[1]
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            expires = time.monotonic() + ex if ex else None
+            self._values[name] = (expires, value)
+
+    def delete(self, *names):
+        with self._lock:
+            for name in names:
+                self._values.pop(name, None)
+
+
+class SharedCache(object):
+    # eviction is left to the server (ttl and its own memory policy), so the
+    # eviction counter only tracks what this process can see: nothing.
+
+    def __init__(self, client, ttl=60, prefix='fyyur:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.stats.record('misses')
+            return None
+        self.stats.record('hits')
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+
+def make_cache(config):
+    backend = config.get('CACHE_BACKEND', 'lru')
+    ttl = config.get('CACHE_TTL', 60)
+    if backend == 'lru':
+        return LRUCache(max_entries=config.get('CACHE_MAX_ENTRIES', 1024), ttl=ttl)
+    if backend == 'local':
+        return SharedCache(LocalClient(), ttl=ttl)
+    if backend == 'redis':
+        # optional dependency, only needed when the shared backend is used
+        import redis
+        return SharedCache(redis.Redis.from_url(config['CACHE_REDIS_URL']), ttl=ttl)
+    raise ValueError('Unknown CACHE_BACKEND: {}'.format(backend))
+
+
+def cached(cache, key, build):
+    # read-through helper: returns the cached value for key, building and
+    # storing it on a miss. a build returning None is not cached.
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        if value is not None:
+            cache.set(key, value)
+    return value
+
+
+def cached_version(cache, key, version, build):
+    # like cached, for values that must match a version read from the database
+    # (a page's validators): the value is stored along with the version it was
+    # built for and rebuilt when that is not the one asked for, so a stale
+    # value is never served under a newer version's ETag
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    value = build()
+    if value is not None:
+        cache.set(key, (version, value))
+    return value
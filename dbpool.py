@@ -0,0 +1,157 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool, QueuePool
+
+# Engine/pool configuration driven by the DB_* settings in config.py, plus
+# checkout wait and saturation figures for the connection pool.
+
+
+class PoolStats(object):
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # callables given (waited, timed_out) for every checkout, see metrics.py
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def record_checkout(self, waited, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        for listener in self.listeners:
+            listener(waited, timed_out)
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a connection
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = True
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+            timed_out = False
+            return connection
+        finally:
+            pool_stats.record_checkout(time.perf_counter() - started, timed_out)
+
+
+def engine_options(config):
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if not uri.startswith('postgres'):
+        # sqlite (development) keeps SQLAlchemy's own pool choice
+        return {}
+
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if config['DB_PGBOUNCER']:
+        # pgbouncer in transaction mode does the pooling and rejects the
+        # startup "options" parameter, and a plain SET would leak to whichever
+        # client gets the server connection next: SET LOCAL per transaction,
+        # see set_local_statement_timeout.
+        options = {'poolclass': NullPool}
+        if timeout:
+            options['execution_options'] = {'local_statement_timeout': timeout}
+        return options
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if timeout:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(timeout)}
+    return options
+
+
+# async (SQLAlchemy asyncio) drivers for the database url schemes in use
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_uri(uri):
+    scheme, rest = uri.split('://', 1)
+    return '{}://{}'.format(ASYNC_DRIVERS[scheme.split('+')[0]], rest)
+
+
+def async_engine_options(config):
+    # engine_options for create_async_engine: the same pool limits on
+    # SQLAlchemy's async-adapted queue pool, and asyncpg's way of passing
+    # startup settings
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if not uri.startswith('postgres'):
+        return {}
+
+    if config['DB_PGBOUNCER']:
+        # asyncpg's prepared statement cache does not survive transaction
+        # pooling either. the SET LOCAL listener runs for async engines too.
+        options = {'poolclass': NullPool, 'connect_args': {'statement_cache_size': 0}}
+        if config['DB_STATEMENT_TIMEOUT']:
+            options['execution_options'] = {'local_statement_timeout': config['DB_STATEMENT_TIMEOUT']}
+        return options
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if timeout:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    return options
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # sqlite ignores foreign keys, ON DELETE CASCADE included, unless asked
+    # per connection (sqlite3 and the aiosqlite adapter alike)
+    if 'sqlite' in type(dbapi_connection).__module__:
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+
+@event.listens_for(Engine, 'begin')
+def set_local_statement_timeout(connection):
+    # registered once for all engines; only those engine_options gave a
+    # local_statement_timeout (the pgbouncer ones) set it
+    timeout = connection.get_execution_options().get('local_statement_timeout')
+    if timeout:
+        connection.exec_driver_sql('SET LOCAL statement_timeout = {:d}'.format(timeout))
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {
+        'checkouts': pool_stats.checkouts,
+        'checkout_timeouts': pool_stats.timeouts,
+        'checkout_wait_seconds_total': pool_stats.wait_seconds_total,
+        'checkout_wait_seconds_max': pool_stats.wait_seconds_max,
+    }
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'saturation': float(pool.checkedout()) / capacity if capacity else 0.0,
+        })
+    return status
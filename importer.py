@@ -0,0 +1,308 @@
+import csv
+import io
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from werkzeug.datastructures import MultiDict
+
+from app import (app, db, SHOW_MAX_DURATION, Venue, Artist, Show, Genre, venue_genres, artist_genres, invalidate_pages,
+                 invalidate_artist_index)
+from bookings import BOOKED_COLUMNS
+from forms import VenueForm, ArtistForm, ShowForm
+
+# Bulk loader behind `flask import`.
+#
+# Rows are streamed from a CSV (header row) or NDJSON file, validated with the
+# same WTForms forms the create pages use, and written in batches, one
+# transaction per batch: Postgres gets COPY, other databases executemany.
+# Rows that fail validation or reference a missing venue/artist are written
+# to a side file (<path>.rejects.ndjson) with their line number and errors,
+# as are shows double-booking their venue or artist, whether with a show
+# already in the database or with an earlier row of the file.
+
+ENTITY_COLUMNS = {
+    'venues': ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+               'website_link', 'seeking_talent', 'seeking_description'),
+    'artists': ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                'website_link', 'seeking_venue', 'seeking_description'),
+}
+
+IMPORTS = {
+    'venues': (Venue, VenueForm, venue_genres),
+    'artists': (Artist, ArtistForm, artist_genres),
+    'shows': (Show, ShowForm, None),
+}
+
+
+def read_rows(path):
+    # yields (line number, row dict) without loading the file into memory
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    yield number, json.loads(line)
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# BooleanField treats any non-empty string but "false" as checked, so the
+# ways a CSV (or hand-written NDJSON) spells false are mapped to it
+BOOLEAN_COLUMNS = {'seeking_talent', 'seeking_venue'}
+FALSE_STRINGS = {'', 'false', '0', 'no', 'n', 'off'}
+
+
+def form_data(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres':
+            genres = value.split(',') if isinstance(value, str) else value
+            for genre in genres:
+                data.add(key, genre.strip())
+        elif key in BOOLEAN_COLUMNS and isinstance(value, str):
+            data.add(key, 'false' if value.strip().lower() in FALSE_STRINGS else 'y')
+        elif isinstance(value, bool):
+            data.add(key, 'y' if value else 'false')
+        elif value is not None:
+            data.add(key, str(value))
+    return data
+
+
+def validate(form_class, row, genre_choices):
+    form = form_class(formdata=form_data(row), meta={'csrf': False})
+    if genre_choices is not None:
+        form.genres.choices = genre_choices
+    if form.validate():
+        return form, None
+    return None, form.errors
+
+
+def allocate_ids(connection, table, count):
+    # COPY and executemany cannot hand back generated keys, so reserve them up
+    # front; the association rows for genres need the entity ids.
+    if connection.dialect.name == 'postgresql':
+        result = connection.execute(
+            db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {'table': table.name, 'count': count})
+        return [row[0] for row in result]
+    start = connection.execute(db.select(db.func.coalesce(db.func.max(table.c.id), 0))).scalar() + 1
+    return list(range(start, start + count))
+
+
+def copy_rows(connection, table, records):
+    if not records:
+        return
+    columns = list(records[0])
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow(['\\N' if record[column] is None else record[column] for column in columns])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+            table.name, ', '.join(columns)), buffer)
+    else:
+        connection.execute(table.insert(), records)
+
+
+def load_entities(connection, model, link, forms, genre_ids):
+    table = model.__table__
+    columns = ENTITY_COLUMNS[table.name]
+    now = datetime.utcnow()
+    ids = allocate_ids(connection, table, len(forms))
+    records = []
+    links = []
+    link_fk = list(link.c)[0].name
+    for entity_id, form in zip(ids, forms):
+        record = {'id': entity_id, 'created_at': now, 'updated_at': now}
+        for column in columns:
+            record[column] = form[column].data
+        records.append(record)
+        for genre in set(form.genres.data):
+            links.append({link_fk: entity_id, 'genre_id': genre_ids[genre]})
+    copy_rows(connection, table, records)
+    copy_rows(connection, link, links)
+
+
+def resolve_ids(connection, model, ids):
+    # one IN query per batch instead of a lookup per row
+    if not ids:
+        return set()
+    return {row[0] for row in connection.execute(db.select(model.id).where(model.id.in_(ids)))}
+
+
+def load_shows(connection, numbered_forms, rejects):
+    for _, _, form in numbered_forms:
+        form.venue_id.data = as_id(form.venue_id.data)
+        form.artist_id.data = as_id(form.artist_id.data)
+    venue_ids = resolve_ids(connection, Venue, {form.venue_id.data for _, _, form in numbered_forms})
+    artist_ids = resolve_ids(connection, Artist, {form.artist_id.data for _, _, form in numbered_forms})
+
+    now = datetime.now()
+    duration = timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
+    candidates = []
+    records = []
+    upcoming = {Venue: Counter(), Artist: Counter()}
+    past = {Venue: Counter(), Artist: Counter()}
+    for number, row, form in numbered_forms:
+        errors = {}
+        if form.venue_id.data not in venue_ids:
+            errors['venue_id'] = ['No such venue.']
+        if form.artist_id.data not in artist_ids:
+            errors['artist_id'] = ['No such artist.']
+        end_time = form.end_time.data or form.start_time.data + duration
+        if not form.start_time.data < end_time <= form.start_time.data + SHOW_MAX_DURATION:
+            errors['end_time'] = ['Must be after start_time, by at most {}.'.format(SHOW_MAX_DURATION)]
+        if errors:
+            rejects.append((number, row, errors))
+            continue
+        candidates.append((number, row, {
+            'venue_id': form.venue_id.data,
+            'artist_id': form.artist_id.data,
+            'start_time': form.start_time.data,
+            'end_time': end_time,
+            'updated_at': datetime.utcnow(),
+        }))
+
+    lock_bookings(connection, candidates)
+    overlaps = double_bookings(connection, [record for _, _, record in candidates])
+    for index, (number, row, record) in enumerate(candidates):
+        if index in overlaps:
+            rejects.append((number, row, overlaps[index]))
+            continue
+        records.append(record)
+        counters = upcoming if record['start_time'] > now else past
+        counters[Venue][record['venue_id']] += 1
+        counters[Artist][record['artist_id']] += 1
+
+    copy_rows(connection, Show.__table__, records)
+
+    # keep the denormalized counters in step, one executemany per table
+    for model in (Venue, Artist):
+        table = model.__table__
+        entity_ids = set(upcoming[model]) | set(past[model])
+        if not entity_ids:
+            continue
+        connection.execute(
+            table.update().where(table.c.id == db.bindparam('entity_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('upcoming'),
+                past_shows_count=table.c.past_shows_count + db.bindparam('past'),
+            ),
+            [{'entity_id': entity_id, 'upcoming': upcoming[model][entity_id], 'past': past[model][entity_id]}
+             for entity_id in entity_ids])
+    touched = {model: set(upcoming[model]) | set(past[model]) for model in (Venue, Artist)}
+    return len(records), touched
+
+
+def lock_bookings(connection, candidates):
+    # postgres: app.lock_bookings for every venue and artist of the batch, all
+    # venues then all artists in id order, the order the show form takes them in
+    if connection.dialect.name != 'postgresql' or not candidates:
+        return
+    keys = sorted({(key, record[column]) for _, _, record in candidates
+                   for key, column in enumerate(BOOKED_COLUMNS, 1)})
+    connection.execute(db.text(
+        'SELECT count(pg_advisory_xact_lock(k, id)) FROM ('
+        'SELECT k, id FROM unnest(CAST(:keys AS int[]), CAST(:ids AS int[])) AS l (k, id) ORDER BY k, id) AS l'),
+        {'keys': [key for key, _ in keys], 'ids': [entity_id for _, entity_id in keys]})
+
+
+def double_bookings(connection, records):
+    # {index: errors} of the records overlapping a show of their venue or
+    # artist, already booked or in an earlier record. the booked shows come
+    # from one range scan per column over the batch's ids and time span.
+    if not records:
+        return {}
+    table = Show.__table__
+    earliest = min(record['start_time'] for record in records) - SHOW_MAX_DURATION
+    latest = max(record['end_time'] for record in records)
+    booked = {}
+    for column in BOOKED_COLUMNS:
+        booked[column] = defaultdict(list)
+        rows = connection.execute(
+            db.select(table.c[column], table.c.start_time, table.c.end_time).where(
+                table.c[column].in_({record[column] for record in records}),
+                table.c.start_time > earliest, table.c.start_time < latest))
+        for entity_id, start_time, end_time in rows:
+            booked[column][entity_id].append((start_time, end_time))
+
+    overlaps = {}
+    for index, record in enumerate(records):
+        errors = {}
+        for column in BOOKED_COLUMNS:
+            if any(start_time < record['end_time'] and end_time > record['start_time']
+                   for start_time, end_time in booked[column][record[column]]):
+                errors[column] = ['Already booked at that time.']
+        if errors:
+            overlaps[index] = errors
+            continue
+        for column in BOOKED_COLUMNS:
+            booked[column][record[column]].append((record['start_time'], record['end_time']))
+    return overlaps
+
+
+def as_id(value):
+    # ShowForm keeps venue_id/artist_id as free text
+    value = str(value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def import_file(kind, path, batch_size=1000, echo=print):
+    model, form_class, link = IMPORTS[kind]
+    genre_ids = None
+    genre_choices = None
+    if link is not None:
+        genre_ids = dict(db.session.query(Genre.name, Genre.id))
+        genre_choices = [(name, name) for name in sorted(genre_ids)]
+
+    loaded = 0
+    rejected = 0
+    started = time.monotonic()
+    with open(path + '.rejects.ndjson', 'w') as rejects_file:
+        for batch in batches(read_rows(path), batch_size):
+            rejects = []
+            valid = []
+            for number, row in batch:
+                form, errors = validate(form_class, row, genre_choices)
+                if errors:
+                    rejects.append((number, row, errors))
+                else:
+                    valid.append((number, row, form))
+
+            connection = db.session.connection()
+            if kind == 'shows':
+                count, touched = load_shows(connection, valid, rejects)
+                loaded += count
+                db.session.commit()
+                invalidate_pages(venue_ids=touched[Venue], artist_ids=touched[Artist])
+            else:
+                load_entities(connection, model, link, [form for _, _, form in valid], genre_ids)
+                loaded += len(valid)
+                db.session.commit()
+                if model is Artist:
+                    invalidate_artist_index({genre for _, _, form in valid for genre in form.genres.data})
+
+            for number, row, errors in rejects:
+                rejects_file.write(json.dumps({'line': number, 'row': row, 'errors': errors}, default=str) + '\n')
+            rejected += len(rejects)
+
+            elapsed = time.monotonic() - started
+            echo('{} {} loaded, {} rejected ({:.0f} rows/sec)'.format(
+                loaded, kind, rejected, (loaded + rejected) / elapsed if elapsed else 0))
+
+    return loaded, rejected
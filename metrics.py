@@ -0,0 +1,132 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from dbpool import pool_stats
+
+# Prometheus metrics, served at /metrics in the text exposition format.
+#
+# Requests are timed per endpoint (the url rule, not the path, so /venues/1 and
+# /venues/2 share a series; urls no rule matched count as "<unmatched>") and
+# counted by status code. The SQL time and statement count sqlstats.py collects for the request, pool
+# checkouts and their waits, page cache lookups and template render times are
+# recorded as they happen. Streamed /api responses are timed up to their first
+# byte. The cache hit ratio is
+#   rate(fyyur_cache_lookups_total{result="hit"}[5m]) / rate(fyyur_cache_lookups_total[5m])
+#
+# A single process serves its own registry. With several worker processes,
+# point PROMETHEUS_MULTIPROC_DIR at an empty directory, created (or emptied)
+# before the workers start: every worker then writes its samples there and
+# /metrics on any of them reports the sum over all workers. Under gunicorn,
+# also have the config file call mark_process_dead from child_exit, so the
+# gauges of a worker that died stop counting:
+#   from metrics import mark_process_dead
+#   def child_exit(server, worker):
+#       mark_process_dead(worker.pid)
+
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_LATENCY = Histogram('fyyur_request_duration_seconds', 'Time to handle a request, by endpoint.',
+                            ['method', 'endpoint'], buckets=LATENCY_BUCKETS)
+RESPONSES = Counter('fyyur_responses_total', 'Responses by endpoint and status code.',
+                    ['method', 'endpoint', 'status'])
+REQUEST_DB_TIME = Histogram('fyyur_request_db_seconds', 'Time spent in SQL statements per request.',
+                            ['endpoint'], buckets=LATENCY_BUCKETS)
+REQUEST_STATEMENTS = Histogram('fyyur_request_db_statements', 'SQL statements run per request.',
+                               ['endpoint'], buckets=STATEMENT_BUCKETS)
+TEMPLATE_RENDER = Histogram('fyyur_template_render_seconds', 'Time to render a template.',
+                            ['template'], buckets=LATENCY_BUCKETS)
+CACHE_LOOKUPS = Counter('fyyur_cache_lookups_total', 'Page cache lookups by result.', ['result'])
+CACHE_EVICTIONS = Counter('fyyur_cache_evictions_total', 'Page cache entries evicted or expired.')
+POOL_IN_USE = Gauge('fyyur_db_pool_connections_in_use', 'Pooled database connections checked out.',
+                    multiprocess_mode='livesum')
+POOL_WAIT = Histogram('fyyur_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+                      buckets=LATENCY_BUCKETS)
+POOL_TIMEOUTS = Counter('fyyur_db_pool_checkout_timeouts_total', 'Pool checkouts that gave up waiting.')
+
+
+def mark_process_dead(pid):
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+def registry():
+    if not MULTIPROCESS:
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def metrics_response():
+    return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def endpoint_label():
+    return request.endpoint or '<unmatched>'
+
+
+def record_cache(name, count):
+    if name == 'evictions':
+        CACHE_EVICTIONS.inc(count)
+    else:
+        CACHE_LOOKUPS.labels('hit' if name == 'hits' else 'miss').inc(count)
+
+
+def record_pool_checkout(waited, timed_out):
+    POOL_WAIT.observe(waited)
+    if timed_out:
+        POOL_TIMEOUTS.inc()
+
+
+@event.listens_for(Pool, 'checkout')
+def connection_checked_out(dbapi_connection, connection_record, connection_proxy):
+    POOL_IN_USE.inc()
+
+
+@event.listens_for(Pool, 'checkin')
+def connection_checked_in(dbapi_connection, connection_record):
+    POOL_IN_USE.dec()
+
+
+def timed_template_class(base):
+    class TimedTemplate(base):
+        def render(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return super(TimedTemplate, self).render(*args, **kwargs)
+            finally:
+                TEMPLATE_RENDER.labels(self.name or '<string>').observe(time.perf_counter() - started)
+    return TimedTemplate
+
+
+def init_app(app, cache):
+    # flask's template signals need blinker, which is not a dependency
+    app.jinja_env.template_class = timed_template_class(app.jinja_env.template_class)
+    cache.stats.listeners.append(record_cache)
+    pool_stats.listeners.append(record_pool_checkout)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'metrics_started' not in g:
+            return response
+        endpoint = endpoint_label()
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - g.metrics_started)
+        RESPONSES.labels(request.method, endpoint, str(response.status_code)).inc()
+        stats = g.get('sql_stats')
+        if stats is not None:
+            REQUEST_DB_TIME.labels(endpoint).observe(stats.seconds)
+            REQUEST_STATEMENTS.labels(endpoint).observe(stats.count)
+        return response
@@ -0,0 +1,112 @@
+"""partition shows by month on start_time and add shows_archive
+
+Revision ID: a4e19b7d6c52
+Revises: f2d8c5a09b37
+Create Date: 2026-10-18 15:02:47.118390
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e19b7d6c52'
+down_revision = 'f2d8c5a09b37'
+branch_labels = None
+depends_on = None
+
+# months of partitions created ahead of today; `flask shows partition` keeps it up
+MONTHS_AHEAD = 12
+
+# index name suffix -> columns, for shows and shows_archive alike
+INDEXES = [
+    ('venue_id_start_time', ['venue_id', 'start_time']),
+    ('artist_id_start_time', ['artist_id', 'start_time']),
+    ('start_time_id', ['start_time', 'id']),
+    ('updated_at', ['updated_at']),
+]
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def create_partitioned(table, id_default=''):
+    # the partition key has to be part of the primary key. the foreign keys are
+    # named as on the unpartitioned table, which later migrations rely on.
+    op.execute(
+        'CREATE TABLE {table} ('
+        'id integer NOT NULL{id_default}, '
+        'artist_id integer NOT NULL CONSTRAINT {table}_artist_id_fkey REFERENCES artists (id), '
+        'venue_id integer NOT NULL CONSTRAINT {table}_venue_id_fkey REFERENCES venues (id), '
+        'start_time timestamp without time zone NOT NULL, '
+        'updated_at timestamp without time zone NOT NULL DEFAULT now(), '
+        'PRIMARY KEY (id, start_time)'
+        ') PARTITION BY RANGE (start_time)'.format(table=table, id_default=id_default)
+    )
+    op.execute('CREATE TABLE {table}_default PARTITION OF {table} DEFAULT'.format(table=table))
+    for suffix, columns in INDEXES:
+        op.create_index('ix_{}_{}'.format(table, suffix), table, columns)
+
+
+def upgrade():
+    op.execute('ALTER TABLE shows RENAME TO shows_unpartitioned')
+    op.execute('ALTER TABLE shows_unpartitioned DROP CONSTRAINT shows_pkey')
+    # free the constraint names for the new table
+    op.drop_constraint('shows_venue_id_fkey', 'shows_unpartitioned', type_='foreignkey')
+    op.drop_constraint('shows_artist_id_fkey', 'shows_unpartitioned', type_='foreignkey')
+    for suffix, columns in INDEXES:
+        op.drop_index('ix_shows_{}'.format(suffix), table_name='shows_unpartitioned')
+
+    create_partitioned('shows', " DEFAULT nextval('shows_id_seq')")
+    create_partitioned('shows_archive')
+
+    # a partition for every month with shows, through MONTHS_AHEAD from now
+    now = datetime.now()
+    first, last = op.get_bind().execute(sa.text('SELECT min(start_time), max(start_time) FROM shows_unpartitioned')).one()
+    month = (min(first, now) if first else now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last = max(last or now, add_months(now, MONTHS_AHEAD))
+    while month <= last:
+        op.execute(
+            "CREATE TABLE shows_y{:%Ym%m} PARTITION OF shows FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')".format(
+                month, month, add_months(month, 1))
+        )
+        month = add_months(month, 1)
+
+    op.execute(
+        'INSERT INTO shows (id, artist_id, venue_id, start_time, updated_at) '
+        'SELECT id, artist_id, venue_id, start_time, updated_at FROM shows_unpartitioned'
+    )
+    # hand the id sequence over before the old table (its owner) goes
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    op.drop_table('shows_unpartitioned')
+
+
+def downgrade():
+    op.execute(
+        'CREATE TABLE shows_unpartitioned ('
+        "id integer NOT NULL DEFAULT nextval('shows_id_seq'), "
+        'artist_id integer NOT NULL, '
+        'venue_id integer NOT NULL, '
+        'start_time timestamp without time zone NOT NULL, '
+        'updated_at timestamp without time zone NOT NULL DEFAULT now())'
+    )
+    op.execute(
+        'INSERT INTO shows_unpartitioned (id, artist_id, venue_id, start_time, updated_at) '
+        'SELECT id, artist_id, venue_id, start_time, updated_at FROM shows '
+        'UNION ALL SELECT id, artist_id, venue_id, start_time, updated_at FROM shows_archive'
+    )
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows_unpartitioned.id')
+    # dropping the parents drops their partitions
+    op.drop_table('shows_archive')
+    op.drop_table('shows')
+
+    op.rename_table('shows_unpartitioned', 'shows')
+    op.create_primary_key('shows_pkey', 'shows', ['id'])
+    op.create_foreign_key('shows_artist_id_fkey', 'shows', 'artists', ['artist_id'], ['id'])
+    op.create_foreign_key('shows_venue_id_fkey', 'shows', 'venues', ['venue_id'], ['id'])
+    for suffix, columns in INDEXES:
+        op.create_index('ix_shows_{}'.format(suffix), 'shows', columns)
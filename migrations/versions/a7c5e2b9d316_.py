@@ -0,0 +1,27 @@
+"""(name, id) index on artists for the paginated listing
+
+Revision ID: a7c5e2b9d316
+Revises: e1f7a3c9b284
+Create Date: 2026-10-18 19:12:40.318842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c5e2b9d316'
+down_revision = 'e1f7a3c9b284'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built CONCURRENTLY, outside a transaction, so artists stay writable
+    with op.get_context().autocommit_block():
+        op.create_index('ix_artists_name_id', 'artists', ['name', 'id'], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_artists_name_id', table_name='artists', postgresql_concurrently=True)
@@ -0,0 +1,38 @@
+"""trigram search indexes on venues and artists
+
+Revision ID: b7c41e2d9a13
+Revises: 760b71485dcd
+Create Date: 2026-10-18 09:12:41.228310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c41e2d9a13'
+down_revision = '760b71485dcd'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = {
+    'venues': ('name', 'city', 'state'),
+    'artists': ('name', 'city', 'state'),
+}
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            op.create_index(
+                'ix_{}_{}_trgm'.format(table, column), table, [column],
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'},
+            )
+
+
+def downgrade():
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
@@ -0,0 +1,41 @@
+"""upcoming/past show counters on venues and artists
+
+Revision ID: c3a8f06e1b52
+Revises: b7c41e2d9a13
+Create Date: 2026-10-18 10:03:17.540182
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f06e1b52'
+down_revision = 'b7c41e2d9a13'
+branch_labels = None
+depends_on = None
+
+COUNTED_TABLES = {
+    'venues': 'venue_id',
+    'artists': 'artist_id',
+}
+
+
+def upgrade():
+    for table, show_fk in COUNTED_TABLES.items():
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        # backfill from the existing shows
+        op.execute(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id '
+            'AND shows.start_time > CURRENT_TIMESTAMP), '
+            'past_shows_count = (SELECT count(*) FROM shows WHERE shows.{fk} = {table}.id '
+            'AND shows.start_time <= CURRENT_TIMESTAMP)'.format(table=table, fk=show_fk)
+        )
+
+
+def downgrade():
+    for table in COUNTED_TABLES:
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,43 @@
+"""cascade venue and artist deletes to shows and genre links in the database
+
+Revision ID: c8d2e4f61a93
+Revises: a4e19b7d6c52
+Create Date: 2026-10-18 17:48:12.530217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8d2e4f61a93'
+down_revision = 'a4e19b7d6c52'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table) of every foreign key to venues or artists.
+# on the partitioned shows and shows_archive the constraint of the parent
+# is replaced on all of its partitions too.
+FOREIGN_KEYS = [
+    ('shows', 'venue_id', 'venues'),
+    ('shows', 'artist_id', 'artists'),
+    ('shows_archive', 'venue_id', 'venues'),
+    ('shows_archive', 'artist_id', 'artists'),
+    ('venue_genres', 'venue_id', 'venues'),
+    ('artist_genres', 'artist_id', 'artists'),
+]
+
+
+def replace_foreign_keys(ondelete):
+    for table, column, referred in FOREIGN_KEYS:
+        name = '{}_{}_fkey'.format(table, column)
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
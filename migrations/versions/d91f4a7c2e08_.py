@@ -0,0 +1,78 @@
+"""normalize genres into a genres table with association tables
+
+Revision ID: d91f4a7c2e08
+Revises: c3a8f06e1b52
+Create Date: 2026-10-18 11:26:52.873410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f4a7c2e08'
+down_revision = 'c3a8f06e1b52'
+branch_labels = None
+depends_on = None
+
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+    'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+    'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+]
+
+# table -> (association table, foreign key column)
+GENRE_LINKS = {
+    'venues': ('venue_genres', 'venue_id'),
+    'artists': ('artist_genres', 'artist_id'),
+}
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genres, [{'name': name} for name in GENRES])
+
+    for table, (link, fk) in GENRE_LINKS.items():
+        op.create_table(link,
+        sa.Column(fk, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([fk], ['{}.id'.format(table)], ),
+        sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+        sa.PrimaryKeyConstraint(fk, 'genre_id')
+        )
+        op.create_index('ix_{}_genre_id'.format(link), link, ['genre_id', fk])
+
+        # genres that only exist in the comma-joined strings become rows too
+        op.execute(
+            "INSERT INTO genres (name) "
+            "SELECT DISTINCT trim(g) FROM {table}, unnest(string_to_array({table}.genres, ',')) AS g "
+            "WHERE trim(g) <> '' ON CONFLICT (name) DO NOTHING".format(table=table)
+        )
+        op.execute(
+            "INSERT INTO {link} ({fk}, genre_id) "
+            "SELECT DISTINCT {table}.id, genres.id FROM {table} "
+            "CROSS JOIN LATERAL unnest(string_to_array({table}.genres, ',')) AS g "
+            "JOIN genres ON genres.name = trim(g)".format(table=table, link=link, fk=fk)
+        )
+        op.drop_column(table, 'genres')
+
+
+def downgrade():
+    op.add_column('venues', sa.Column('genres', sa.VARCHAR(), autoincrement=False, nullable=True))
+    op.add_column('artists', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+    for table, (link, fk) in GENRE_LINKS.items():
+        op.execute(
+            "UPDATE {table} SET genres = (SELECT string_agg(genres.name, ',') FROM {link} "
+            "JOIN genres ON genres.id = {link}.genre_id WHERE {link}.{fk} = {table}.id)".format(
+                table=table, link=link, fk=fk)
+        )
+        op.drop_index('ix_{}_genre_id'.format(link), table_name=link)
+        op.drop_table(link)
+    op.execute("UPDATE venues SET genres = '' WHERE genres IS NULL")
+    op.alter_column('venues', 'genres', existing_type=sa.VARCHAR(), nullable=False)
+    op.drop_table('genres')
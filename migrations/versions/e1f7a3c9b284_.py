@@ -0,0 +1,68 @@
+"""show end times and double-booking exclusion constraints
+
+Revision ID: e1f7a3c9b284
+Revises: c8d2e4f61a93
+Create Date: 2026-10-18 18:31:05.772641
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f7a3c9b284'
+down_revision = 'c8d2e4f61a93'
+branch_labels = None
+depends_on = None
+
+# existing shows get the default length (SHOW_DURATION_MINUTES)
+DURATION_MINUTES = 120
+# bookings.MAX_DURATION
+MAX_DURATION_HOURS = 24
+BOOKED_COLUMNS = ('venue_id', 'artist_id')
+
+
+def current_partitions():
+    # monthly partitions of shows from this month on. past months are left
+    # without exclusion constraints: they are history, bookings go ahead.
+    first = 'shows_y{:%Ym%m}'.format(datetime.now())
+    rows = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'shows'::regclass AND c.relname ~ '^shows_y[0-9]{4}m[0-9]{2}$'"))
+    return sorted(name for name, in rows if name >= first)
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for table in ('shows', 'shows_archive'):
+        op.add_column(table, sa.Column('end_time', sa.DateTime(), nullable=True))
+        op.execute("UPDATE {} SET end_time = start_time + interval '{} minutes'".format(table, DURATION_MINUTES))
+        op.alter_column(table, 'end_time', nullable=False)
+        op.create_check_constraint('ck_{}_end_time'.format(table), table, 'end_time > start_time')
+    op.create_check_constraint('ck_shows_max_duration', 'shows',
+                               "end_time <= start_time + interval '{} hours'".format(MAX_DURATION_HOURS))
+
+    # fails, naming the two shows, if upcoming shows already overlap with the
+    # default length; shorten or move them and run it again
+    for partition in current_partitions():
+        for column in BOOKED_COLUMNS:
+            op.execute(
+                'ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_overlap '
+                'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'.format(
+                    table=partition, column=column)
+            )
+
+
+def downgrade():
+    # the exclusion constraints of every partition, archived ones included
+    rows = op.get_bind().execute(sa.text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'x' AND conname ~ '_(venue|artist)_id_overlap$'"))
+    for table, name in rows.fetchall():
+        op.drop_constraint(name, table)
+    op.drop_constraint('ck_shows_max_duration', 'shows')
+    for table in ('shows', 'shows_archive'):
+        op.drop_constraint('ck_{}_end_time'.format(table), table)
+        op.drop_column(table, 'end_time')
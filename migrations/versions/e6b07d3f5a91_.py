@@ -0,0 +1,30 @@
+"""updated_at version columns on venues, artists and shows
+
+Revision ID: e6b07d3f5a91
+Revises: d91f4a7c2e08
+Create Date: 2026-10-18 12:41:05.316774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b07d3f5a91'
+down_revision = 'd91f4a7c2e08'
+branch_labels = None
+depends_on = None
+
+VERSIONED_TABLES = ('venues', 'artists', 'shows')
+
+
+def upgrade():
+    for table in VERSIONED_TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in VERSIONED_TABLES:
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        op.drop_column(table, 'updated_at')
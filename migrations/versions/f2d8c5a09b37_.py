@@ -0,0 +1,37 @@
+"""composite indexes on shows and venues
+
+Revision ID: f2d8c5a09b37
+Revises: e6b07d3f5a91
+Create Date: 2026-10-18 14:10:33.905214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2d8c5a09b37'
+down_revision = 'e6b07d3f5a91'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time']),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time']),
+    ('ix_shows_start_time_id', 'shows', ['start_time', 'id']),
+    ('ix_venues_city_state', 'venues', ['city', 'state']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY keeps the tables writable while the indexes build, but it
+    # cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
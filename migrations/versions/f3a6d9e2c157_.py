@@ -0,0 +1,30 @@
+"""case-insensitive (upper(name), id) index for the paginated artist listing
+
+Revision ID: f3a6d9e2c157
+Revises: d5f1b8c3e724
+Create Date: 2026-10-18 21:37:52.184406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a6d9e2c157'
+down_revision = 'd5f1b8c3e724'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built CONCURRENTLY, outside a transaction, so artists stay writable
+    with op.get_context().autocommit_block():
+        op.create_index('ix_artists_upper_name_id', 'artists', [sa.text('upper(name)'), 'id'],
+                        postgresql_concurrently=True)
+        op.drop_index('ix_artists_name_id', table_name='artists', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_artists_name_id', 'artists', ['name', 'id'], postgresql_concurrently=True)
+        op.drop_index('ix_artists_upper_name_id', table_name='artists', postgresql_concurrently=True)
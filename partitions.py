@@ -0,0 +1,103 @@
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+from bookings import exclude_overlaps
+
+# Monthly range partitions of the shows table (Postgres only).
+#
+# shows is PARTITION BY RANGE (start_time) with one partition per month named
+# <table>_yYYYYmMM, plus a <table>_default partition catching start times no
+# monthly partition covers (yet). shows_archive has the same layout and takes
+# over whole monthly partitions once they are old enough, so the live table,
+# and every upcoming-show query pruned down to it, only holds recent months.
+# The partitions keep their shows_ name in the archive.
+
+PARTITION_NAME = re.compile(r'^\w+_y(?P<year>\d{4})m(?P<month>\d{2})$')
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return '{}_y{:04d}m{:02d}'.format(table, month.year, month.month)
+
+
+def bounds(month):
+    # FOR VALUES clause of a monthly partition; DDL takes no bind parameters
+    return "FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')".format(month, add_months(month, 1))
+
+
+def is_partitioned(connection, table):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))'),
+        {'table': table}).scalar()
+
+
+def monthly_partitions(connection, table):
+    # {first day of month: partition name} of the monthly partitions attached to table
+    rows = connection.execute(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = to_regclass(:table)'), {'table': table})
+    partitions = {}
+    for name, in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match.group('year')), int(match.group('month')), 1)] = name
+    return partitions
+
+
+def create_partition(connection, table, month):
+    # the partition is built detached and attached afterwards: rows for its
+    # month that already landed in the default partition are moved into it
+    # first, postgres refuses to attach a range the default partition has
+    # rows for. ATTACH only takes a SHARE UPDATE EXCLUSIVE lock on the parent.
+    name = partition_name(table, month)
+    window = {'start': month, 'end': add_months(month, 1)}
+    connection.execute(text('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'.format(name, table)))
+    connection.execute(text(
+        'WITH moved AS (DELETE FROM {table}_default WHERE start_time >= :start AND start_time < :end RETURNING *) '
+        'INSERT INTO {name} SELECT * FROM moved'.format(table=table, name=name)), window)
+    # exclusion constraints cannot span partitions, each one gets its own
+    exclude_overlaps(connection, name)
+    connection.execute(text('ALTER TABLE {} ATTACH PARTITION {} {}'.format(table, name, bounds(month))))
+    return name
+
+
+def ensure_partitions(connection, table, months_ahead, now=None):
+    # creates the missing monthly partitions from the current month through
+    # months_ahead months from now; returns the names of the new ones
+    month = month_start(now or datetime.now())
+    existing = monthly_partitions(connection, table)
+    created = []
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            created.append(create_partition(connection, table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partitions(connection, table, archive, before):
+    # moves the monthly partitions of table that end on or before `before`
+    # over to archive, along with default-partition rows older than that.
+    # DETACH briefly takes an ACCESS EXCLUSIVE lock on table.
+    moved = []
+    for month, name in sorted(monthly_partitions(connection, table).items()):
+        if add_months(month, 1) > before:
+            break
+        connection.execute(text('ALTER TABLE {} DETACH PARTITION {}'.format(table, name)))
+        connection.execute(text('ALTER TABLE {} ATTACH PARTITION {} {}'.format(archive, name, bounds(month))))
+        moved.append(name)
+    connection.execute(text(
+        'WITH moved AS (DELETE FROM {table}_default WHERE start_time < :before RETURNING *) '
+        'INSERT INTO {archive} SELECT * FROM moved'.format(table=table, archive=archive)), {'before': before})
+    return moved
@@ -0,0 +1,112 @@
+import itertools
+import threading
+import time
+
+from flask import has_request_context, request, session as flask_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+
+from dbpool import engine_options
+
+# Read-replica routing.
+#
+# Reads issued while handling a GET/HEAD request go to one of the engines in
+# SQLALCHEMY_REPLICA_URIS; everything else stays on the primary:
+#   - non-GET requests, CLI commands and anything outside a request
+#   - flushes and bulk UPDATE/DELETE, and every read after them in the same
+#     session (GET /venues/<id>/del writes)
+#   - the DB_READ_YOUR_WRITES_SECONDS after a request committed a write, so a
+#     user redirected from an edit sees it even if the replicas lag behind
+# Without replicas configured the routing is a no-op.
+
+
+def request_reads_from_replica():
+    # GET/HEAD requests read from a replica unless this client committed a
+    # write within the last DB_READ_YOUR_WRITES_SECONDS
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    return time.time() >= flask_session.get('read_primary_until', 0)
+
+
+class ReplicaRouter(object):
+
+    def __init__(self, engines, strategy='round_robin'):
+        if strategy not in ('round_robin', 'least_connections'):
+            raise ValueError('Unknown DB_REPLICA_STRATEGY: {}'.format(strategy))
+        self.engines = engines
+        self.strategy = strategy
+        self._cycle = itertools.cycle(engines)
+        self._in_use = dict.fromkeys(engines, 0)
+        self._lock = threading.Lock()
+        for engine in engines:
+            self._track_connections(engine)
+
+    @classmethod
+    def from_config(cls, config):
+        engines = []
+        for uri in config.get('SQLALCHEMY_REPLICA_URIS', []):
+            options = engine_options(dict(config, SQLALCHEMY_DATABASE_URI=uri))
+            engines.append(create_engine(uri, **options))
+        return cls(engines, config.get('DB_REPLICA_STRATEGY', 'round_robin'))
+
+    def _track_connections(self, engine):
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self._in_use[engine] += 1
+
+        def checkin(dbapi_connection, connection_record):
+            with self._lock:
+                self._in_use[engine] -= 1
+
+        event.listen(engine, 'checkout', checkout)
+        event.listen(engine, 'checkin', checkin)
+
+    def pick(self):
+        if not self.engines:
+            return None
+        with self._lock:
+            if self.strategy == 'least_connections':
+                return min(self.engines, key=self._in_use.get)
+            return next(self._cycle)
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.replicas = db.replicas
+        self.replica = None
+        self.wrote = False
+        SignallingSession.__init__(self, db, **options)
+
+    def reads_from_replica(self, clause):
+        if not getattr(clause, 'is_select', False) or self._flushing or self.wrote:
+            return False
+        return request_reads_from_replica()
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.reads_from_replica(clause):
+            # stick to one replica per session so a request reads one snapshot
+            if self.replica is None:
+                self.replica = self.replicas.pick()
+            if self.replica is not None:
+                return self.replica
+        elif self._flushing or (clause is not None and not getattr(clause, 'is_select', False)):
+            self.wrote = True
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def read_your_writes(db_session):
+    if db_session.wrote and db_session.replicas.engines and has_request_context():
+        window = db_session.app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+        flask_session['read_primary_until'] = time.time() + window
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        self.replicas = ReplicaRouter.from_config(app.config)
+        super(RoutingSQLAlchemy, self).init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,170 @@
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from app import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, sweep_show_counters
+from importer import allocate_ids, copy_rows
+
+# Synthetic data behind `flask seed` and the benchmarks.
+#
+# Venues and artists are spread over cities by rough population weights and
+# get one to three genres skewed towards the popular ones. Shows pick their
+# venue and artist from a Zipf-like popularity curve, so a few venues and
+# artists carry a large share of the shows while most have a handful, and
+# start in the evening, about three quarters of them in the past. Shows run
+# two hours in one of three evening slots, and a draw that would double-book
+# its venue or artist is redrawn (or dropped after a few tries). Everything is
+# drawn from one seeded random.Random: the same arguments give the same data.
+
+CITIES = [
+    ('New York', 'NY', 30), ('Los Angeles', 'CA', 22), ('Chicago', 'IL', 14), ('Houston', 'TX', 10),
+    ('San Francisco', 'CA', 10), ('Austin', 'TX', 9), ('Nashville', 'TN', 9), ('Seattle', 'WA', 7),
+    ('New Orleans', 'LA', 7), ('Atlanta', 'GA', 7), ('Boston', 'MA', 6), ('Denver', 'CO', 5),
+    ('Portland', 'OR', 5), ('Philadelphia', 'PA', 5), ('Miami', 'FL', 5), ('Detroit', 'MI', 4),
+    ('Minneapolis', 'MN', 4), ('Memphis', 'TN', 3), ('Kansas City', 'MO', 2), ('Burlington', 'VT', 1),
+]
+
+GENRE_WEIGHTS = {
+    'Rock n Roll': 14, 'Pop': 12, 'Hip-Hop': 11, 'Electronic': 9, 'Alternative': 8, 'Jazz': 7,
+    'Country': 6, 'R&B': 6, 'Folk': 5, 'Blues': 4, 'Punk': 4, 'Soul': 4, 'Heavy Metal': 3,
+    'Classical': 3, 'Reggae': 3, 'Funk': 3, 'Instrumental': 2, 'Musical Theatre': 2, 'Other': 2,
+}
+
+VENUE_WORDS = (
+    ['The Blue', 'The Velvet', 'The Dueling', 'Park Square', 'The Golden', 'Midnight', 'The Broken', 'Union'],
+    ['Room', 'Lounge', 'Hall', 'Theatre', 'Pianos Bar', 'Music & Coffee', 'Warehouse', 'Ballroom'],
+)
+ARTIST_WORDS = (
+    ['Guns N', 'The Wild', 'Matt', 'Electric', 'Silver', 'Velvet', 'Lonesome', 'Neon'],
+    ['Petals', 'Sax Band', 'Quevado', 'Owls', 'Revival', 'Ghosts', 'Riders', 'Collective'],
+)
+
+PAST_DAYS = 730
+UPCOMING_DAYS = 365
+PAST_SHARE = 0.75
+SLOT_HOURS = (18, 20, 22)
+SHOW_LENGTH = timedelta(hours=2)
+# draws per show before giving up on a free slot
+SLOT_ATTEMPTS = 10
+
+
+def name(rng, words):
+    return '{} {}'.format(rng.choice(words[0]), rng.choice(words[1]))
+
+
+def entity_records(rng, model, count, now):
+    cities = [(city, state) for city, state, _ in CITIES]
+    city_weights = list(accumulate(weight for _, _, weight in CITIES))
+    records = []
+    for city, state in rng.choices(cities, cum_weights=city_weights, k=count):
+        record = {
+            'city': city,
+            'state': state,
+            'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'image_link': None,
+            'facebook_link': None,
+            'website_link': None,
+            'seeking_description': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+        if model is Venue:
+            record.update(name=name(rng, VENUE_WORDS), address='{} Main Street'.format(rng.randint(1, 9999)),
+                          seeking_talent=rng.random() < 0.3)
+        else:
+            record.update(name=name(rng, ARTIST_WORDS), seeking_venue=rng.random() < 0.3)
+        records.append(record)
+    return records
+
+
+def seed_entities(connection, rng, model, link, count, genre_ids, batch_size, now):
+    table = model.__table__
+    link_fk = list(link.c)[0].name
+    genres = list(GENRE_WEIGHTS)
+    genre_weights = list(accumulate(GENRE_WEIGHTS.values()))
+    ids = []
+    for start in range(0, count, batch_size):
+        records = entity_records(rng, model, min(batch_size, count - start), now)
+        batch_ids = allocate_ids(connection, table, len(records))
+        links = []
+        for entity_id, record in zip(batch_ids, records):
+            record['id'] = entity_id
+            for genre in set(rng.choices(genres, cum_weights=genre_weights, k=rng.randint(1, 3))):
+                links.append({link_fk: entity_id, 'genre_id': genre_ids[genre]})
+        copy_rows(connection, table, records)
+        copy_rows(connection, link, links)
+        ids.extend(batch_ids)
+    return ids
+
+
+def popularity(ids):
+    # cumulative zipf-like weights: the n-th entity is picked ~1/n**0.8 as often as the first
+    return list(accumulate(1.0 / rank ** 0.8 for rank in range(1, len(ids) + 1)))
+
+
+def free_slot(rng, venue_id, artist_id, taken):
+    # a (day, hour) neither the venue nor the artist is booked for, or None
+    for _ in range(SLOT_ATTEMPTS):
+        if rng.random() < PAST_SHARE:
+            day = -rng.randint(1, PAST_DAYS)
+        else:
+            day = rng.randint(1, UPCOMING_DAYS)
+        slot = (day, rng.choice(SLOT_HOURS))
+        if (Venue, venue_id) + slot not in taken and (Artist, artist_id) + slot not in taken:
+            taken.update([(Venue, venue_id) + slot, (Artist, artist_id) + slot])
+            return slot
+    return None
+
+
+def seed_shows(connection, rng, count, venue_ids, artist_ids, batch_size, now):
+    # returns the number of shows inserted, short of count when popular
+    # venues or artists ran out of free slots
+    venue_weights = popularity(venue_ids)
+    artist_weights = popularity(artist_ids)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    taken = set()
+    inserted = 0
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        venues = rng.choices(venue_ids, cum_weights=venue_weights, k=size)
+        artists = rng.choices(artist_ids, cum_weights=artist_weights, k=size)
+        records = []
+        for venue_id, artist_id in zip(venues, artists):
+            slot = free_slot(rng, venue_id, artist_id, taken)
+            if slot is None:
+                continue
+            day, hour = slot
+            start_time = midnight + timedelta(days=day, hours=hour)
+            records.append({'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time,
+                            'end_time': start_time + SHOW_LENGTH, 'updated_at': now})
+        copy_rows(connection, Show.__table__, records)
+        inserted += len(records)
+    return inserted
+
+
+def seed_database(venues, artists, shows, seed=0, batch_size=10000, echo=print):
+    # adds the given numbers of venues, artists and shows to whatever is in the
+    # database already, inserted batch_size rows at a time (COPY on postgres),
+    # then refreshes the show counters
+    rng = random.Random(seed)
+    now = datetime.now()
+    genre_ids = dict(db.session.query(Genre.name, Genre.id))
+    started = time.monotonic()
+
+    connection = db.session.connection()
+    venue_ids = seed_entities(connection, rng, Venue, venue_genres, venues, genre_ids, batch_size, now)
+    artist_ids = seed_entities(connection, rng, Artist, artist_genres, artists, genre_ids, batch_size, now)
+    db.session.commit()
+    echo('{} venues, {} artists ({:.1f}s)'.format(len(venue_ids), len(artist_ids), time.monotonic() - started))
+
+    if shows and venue_ids and artist_ids:
+        shows = seed_shows(db.session.connection(), rng, shows, venue_ids, artist_ids, batch_size, now)
+        db.session.commit()
+        echo('{} shows ({:.1f}s)'.format(shows, time.monotonic() - started))
+
+    sweep_show_counters()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+    return len(venue_ids), len(artist_ids), shows
@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL instrumentation.
+#
+# Every statement any engine runs while a request is handled is counted and
+# timed on flask.g. Statements are grouped by shape (the SQL text with
+# whitespace and expanded IN lists collapsed); a shape repeated
+# SQL_N_PLUS_ONE_THRESHOLD times in one request is reported as a probable
+# N+1, with the view that handled the request and the line of project code
+# that first ran it. In debug the figures go into response headers, otherwise
+# into one log record per request (a warning when an N+1 was seen).
+# Statements a streamed response runs after the view returned are not counted.
+
+MODULE_FILE = os.path.abspath(__file__)
+PROJECT_DIR = os.path.dirname(MODULE_FILE)
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+|:\w+))+\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.timings = []
+        self.shapes = {}
+        self.locations = {}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.timings.append((seconds, statement))
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if shape not in self.locations:
+            self.locations[shape] = caller_location()
+
+    def slowest(self, count):
+        return sorted(self.timings, key=lambda timing: timing[0], reverse=True)[:count]
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.items() if count >= threshold]
+
+
+def statement_shape(statement):
+    return PLACEHOLDER_LIST.sub('(?)', WHITESPACE.sub(' ', statement).strip())
+
+
+def caller_location():
+    # first frame in this project's code outside this module, as "file:line"
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and filename != MODULE_FILE and 'site-packages' not in filename:
+            return '{}:{}'.format(os.path.relpath(filename, PROJECT_DIR), frame.f_lineno)
+        frame = frame.f_back
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'sql_stats' in g:
+        conn.info.setdefault('sql_stats_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('sql_stats_started')
+    if started and has_app_context() and 'sql_stats' in g:
+        g.sql_stats.record(statement, time.perf_counter() - started.pop())
+
+
+def view_name(app):
+    view = app.view_functions.get(request.endpoint)
+    return '{}.{}'.format(view.__module__, view.__qualname__) if view else request.endpoint
+
+
+def report(app, stats, response):
+    threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+    repeated = stats.repeated(threshold)
+    slowest = stats.slowest(app.config['SQL_SLOWEST_STATEMENTS'])
+
+    if app.debug:
+        response.headers['X-SQL-Count'] = str(stats.count)
+        response.headers['X-SQL-Time-Ms'] = '{:.2f}'.format(stats.seconds * 1000)
+        response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} statements"'.format(
+            stats.seconds * 1000, stats.count))
+        for shape, count in repeated:
+            response.headers.add('X-SQL-N-Plus-One', '{}x in {} at {}: {}'.format(
+                count, view_name(app), stats.locations[shape], shape[:200]))
+        return response
+
+    # the request id, method, path and endpoint are added by applog.py
+    record = {
+        'status': response.status_code,
+        'statements': stats.count,
+        'db_ms': round(stats.seconds * 1000, 2),
+        'slowest': [{'ms': round(seconds * 1000, 2), 'statement': statement} for seconds, statement in slowest],
+    }
+    logger = app.logger.getChild('sql')
+    if repeated:
+        record['n_plus_one'] = [{'view': view_name(app), 'location': stats.locations[shape], 'count': count,
+                                 'statement': shape} for shape, count in repeated]
+        logger.warning('probable n+1 queries', extra=record)
+    else:
+        logger.info('sql', extra=record)
+    return response
+
+
+def init_app(app):
+    @app.before_request
+    def start_request_stats():
+        g.sql_stats = RequestStats()
+
+    @app.after_request
+    def report_request_stats(response):
+        if 'sql_stats' in g:
+            report(app, g.sql_stats, response)
+        return response
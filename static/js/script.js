@@ -2,3 +2,32 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// ID fields with data-suggest="artist|venue": typing the start of a name lists
+// the matching ids (from /api/suggest) in the field's datalist
+document.querySelectorAll('input[data-suggest]').forEach(function (input) {
+  var datalist = document.getElementById(input.getAttribute('list'));
+  var pending = null;
+  input.addEventListener('input', function () {
+    var q = input.value.trim();
+    clearTimeout(pending);
+    if (!q || /^\d+$/.test(q)) {
+      return;
+    }
+    pending = setTimeout(function () {
+      var url = '/api/suggest?type=' + input.dataset.suggest + '&q=' + encodeURIComponent(q);
+      fetch(url).then(function (response) {
+        return response.json();
+      }).then(function (body) {
+        datalist.innerHTML = '';
+        body.data.forEach(function (match) {
+          var option = document.createElement('option');
+          option.value = match.id;
+          option.label = match.name;
+          option.textContent = match.name;
+          datalist.appendChild(option);
+        });
+      });
+    }, 150);
+  });
+});
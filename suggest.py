@@ -0,0 +1,95 @@
+import bisect
+import threading
+import time
+
+# In-process prefix index behind /api/suggest.
+#
+# Names are kept in a list of (casefolded name, name, id) tuples sorted by the
+# first item, so the matches of a prefix are one contiguous run found with
+# bisect, already in alphabetical order. Every process has its own copy: the
+# app builds it from the database on first use and rebuilds it in the
+# background once it is SUGGEST_MAX_AGE seconds old (how writes made by other
+# workers get here), and the create/edit/delete views of this process update
+# it in place. Lookups keep reading the current entries during a rebuild, and
+# updates made while it reads the database are replayed on its result.
+
+
+def fold(name):
+    return name.strip().casefold()
+
+
+class PrefixIndex(object):
+
+    def __init__(self):
+        self.built_at = None
+        self._entries = []
+        self._keys = {}
+        self._building = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def claim_build(self, max_age):
+        # True for the one caller that should (re)build the index now; the
+        # others keep reading the current entries meanwhile
+        with self._lock:
+            if self._building:
+                return False
+            if self.built_at is not None and time.monotonic() - self.built_at < max_age:
+                return False
+            self._building = True
+            return True
+
+    def build(self, rows):
+        # rows of (id, name); replaces the whole index. the rows may predate
+        # puts and removes made since claim_build, so those are applied again.
+        entries = sorted((fold(name), name, entity_id) for entity_id, name in rows if name)
+        with self._lock:
+            self._entries = entries
+            self._keys = {entity_id: (key, name, entity_id) for key, name, entity_id in entries}
+            pending, self._pending = self._pending, []
+            self._building = False
+            for entity_id, name in pending:
+                self._put(entity_id, name)
+            self.built_at = time.monotonic()
+
+    def abandon_build(self):
+        with self._lock:
+            self._pending = []
+            self._building = False
+
+    def put(self, entity_id, name):
+        with self._lock:
+            self._put(entity_id, name)
+
+    def remove(self, entity_id):
+        with self._lock:
+            self._put(entity_id, None)
+
+    def _put(self, entity_id, name):
+        # name None removes the entry
+        if self._building:
+            self._pending.append((entity_id, name))
+        self._discard(entity_id)
+        if name:
+            entry = (fold(name), name, entity_id)
+            bisect.insort(self._entries, entry)
+            self._keys[entity_id] = entry
+
+    def _discard(self, entity_id):
+        entry = self._keys.pop(entity_id, None)
+        if entry is not None:
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def search(self, prefix, limit):
+        # up to limit (id, name) pairs whose name starts with prefix, ignoring case
+        prefix = fold(prefix)
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (prefix,))
+            matches = []
+            for key, name, entity_id in self._entries[position:position + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append((entity_id, name))
+        return matches